@@ -1,14 +1,13 @@
-import re
 import textwrap
 
 import enigma
+import stream
 
 def encode(e, i, key, msg):
     assert(len(key) == 3)
 
     # normalize message
-    norm_msg = msg.replace(' ', 'X').upper()
-    norm_msg = re.sub(r'[^A-Z]', '', norm_msg)
+    norm_msg = stream.normalize(msg)
 
     # set position using key
     e.setPosition(key)
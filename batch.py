@@ -0,0 +1,134 @@
+import collections
+import multiprocessing
+
+import compiled
+import stepping
+
+Key = collections.namedtuple('Key', 'rotors rf pos ring cables', defaults=(None, None, None))
+
+def make_machine(key):
+    key = Key(*key)
+    if len(key.rotors) == 4:
+        return compiled.CompiledEnigma4(*key.rotors, key.rf, key.pos, key.ring, key.cables)
+    return compiled.CompiledEnigma(*key.rotors, key.rf, key.pos, key.ring, key.cables)
+
+def table_key(key):
+    # machines with equal table keys share one scrambler table; an M4's
+    # greek wheel offset is folded into its reflector
+    greek = None
+    if len(key.rotors) == 4:
+        greek = (ord((key.pos or 'A')[0]) - ord((key.ring or 'A')[0])) % 26
+    return tuple(key.rotors), key.rf, greek
+
+def encrypt(msg, key):
+    # the stepping sequence as integer states, their scrambler offsets and
+    # one gather from the scrambler data, with the plugboard applied to the
+    # whole message by bytes.translate on each side
+    key = Key(*key)
+    if compiled.NOT_LETTERS.search(msg):
+        return compiled.pass_through(lambda m: encrypt(m, key), msg)
+    data, pos, ring = compiled.key_data(key.rotors, key.rf, key.pos, key.ring)
+    states = stepping.Stepping(*key.rotors[-3:], pos).positions(len(msg))
+    plug = compiled.plugboard_perm(key.cables)
+    plug_in = bytes(compiled.A) + plug + bytes(256 - compiled.A - 26)
+    plug_out = plug.translate(compiled.LETTERS) + compiled.PAD
+    inputs = msg.encode().translate(plug_in)
+    index = [o * 26 + x for o, x in zip(compiled.ring_offsets(states, ring), inputs)]
+    return bytes(map(data.__getitem__, index)).translate(plug_out).decode()
+
+def _encrypt(job):
+    return [encrypt(msg, key) for msg, key in job]
+
+def encrypt_batch(messages, keys, processes=1, chunksize=256):
+    if len(messages) != len(keys):
+        raise ValueError('need one key per message')
+    keys = [Key(*key) for key in keys]
+
+    # keep keys sharing rotors and reflector together so each worker builds
+    # the core scrambler tables once per group
+    order = sorted(range(len(keys)), key=lambda i: table_key(keys[i]))
+    jobs = [[(messages[i], keys[i]) for i in order[n:n + chunksize]]
+            for n in range(0, len(order), chunksize)]
+
+    if processes == 1:
+        results = map(_encrypt, jobs)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_encrypt, jobs)
+
+    out = [None] * len(keys)
+    for i, c in zip(order, (c for r in results for c in r)):
+        out[i] = c
+    return out
+
+def _encrypt_segment(job):
+    key, offset, msg = job
+    return make_machine(key).translateAt(msg, offset)
+
+def encrypt_long(message, key, processes=None, size=1 << 16):
+    # every segment seeks straight to its starting rotor state, so the
+    # segments are independent and join into the serial result
+    key = Key(*key)
+    jobs = [(key, i, message[i:i + size]) for i in range(0, len(message), size)]
+    if processes == 1 or len(jobs) < 2:
+        return ''.join(map(_encrypt_segment, jobs))
+    with multiprocessing.Pool(processes) as pool:
+        return ''.join(pool.map(_encrypt_segment, jobs))
+
+if __name__ == '__main__':
+    import unittest
+
+    import enigma
+
+    class TestBatch(unittest.TestCase):
+
+        keys = [ (('I', 'II', 'III'), 'B'),
+                 (('V', 'II', 'IV'), 'C', None, None, ['AB', 'QZ', 'LM', 'OE', 'NC', 'TW']),
+                 Key(('I', 'IV', 'V'), 'B', 'FJN', 'AOA', ['AL', 'CT', 'FN', 'OY']),
+                 (('I', 'II', 'III'), 'B', 'QDV'),
+                 Key(('Gamma', 'VI', 'VII', 'IV'), 'CThin', 'QKTE', 'CLRM', ['AX', 'BU', 'FY']) ]
+
+        def reference(self, msg, key):
+            key = Key(*key)
+            if len(key.rotors) == 4:
+                e = enigma.Enigma4(*key.rotors, key.rf, key.pos, key.ring, key.cables)
+            else:
+                e = enigma.Enigma(*key.rotors, key.rf, key.pos, key.ring, key.cables)
+            return e.translate(msg)
+
+        def test_serial(self):
+            msgs = ['A' * 500, 'HELLOWORLD' * 20, 'B' * 1000, 'Z', 'A' * 700]
+            self.assertEqual(encrypt_batch(msgs, self.keys, chunksize=2),
+                             [self.reference(m, k) for m, k in zip(msgs, self.keys)])
+
+        def test_parallel(self):
+            msgs = ['KNOWLEDGEISPOWER' * (i + 1) for i in range(len(self.keys))]
+            self.assertEqual(encrypt_batch(msgs, self.keys, processes=2, chunksize=1),
+                             [self.reference(m, k) for m, k in zip(msgs, self.keys)])
+
+        def test_long(self):
+            msg = 'THEQUICKBROWNFOXJUMPSOVERTHELAZYDOG' * 1000
+            for key in self.keys:
+                want = self.reference(msg, key)
+                self.assertEqual(encrypt_long(msg, key, processes=1, size=777), want)
+                self.assertEqual(encrypt_long(msg, key, processes=2, size=5000), want)
+            self.assertEqual(encrypt_long('', self.keys[0]), '')
+
+        def test_m4(self):
+            keys = [Key(('Beta' if i % 2 else 'Gamma', 'II', 'IV', 'I'), 'BThin' if i % 3 else 'CThin',
+                        'ABCD'[i % 4] + 'XYZ', 'CA' + 'BCD'[i % 3] + 'E', ['AX', 'BU'])
+                    for i in range(40)]
+            msgs = ['WETTERVORHERSAGE' * (i % 5 + 1) for i in range(40)]
+            self.assertEqual(encrypt_batch(msgs, keys, processes=2, chunksize=7),
+                             [self.reference(m, k) for m, k in zip(msgs, keys)])
+            self.assertEqual(table_key(keys[1])[2], 25)
+
+        def test_encrypt(self):
+            for key in self.keys:
+                for msg in ('', 'A', 'THEQUICKBROWNFOXJUMPSOVERTHELAZYDOG' * 600, 'Hello World, HELLO WORLD!'):
+                    self.assertEqual(encrypt(msg, key), self.reference(msg, key))
+
+        def test_mismatch(self):
+            self.assertRaises(ValueError, encrypt_batch, ['A'], [])
+
+    unittest.main()
@@ -0,0 +1,167 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+import batch
+import compiled
+import enigma
+import keystream
+import plugboard
+import stepping
+
+# keys and inputs of the test vectors in enigma.py
+VECTORS = [
+    (('III', 'IV', 'V'), 'B', 'AJD', None, None, 'A' * 2),
+    (('VIII', 'VII', 'VI'), 'C', None, 'VGI', None, 'A' * 1000),
+    (('V', 'II', 'IV'), 'C', None, None, ['AB', 'QZ', 'LM', 'OE', 'NC', 'TW'], 'A' * 1000),
+    (('I', 'II', 'III'), 'B', None, None, None, 'A' * 1600),
+    (('Beta', 'I', 'II', 'III'), 'BThin', None, None, None, 'A' * 1600),
+    (('Gamma', 'VI', 'VII', 'IV'), 'CThin', 'QKTE', 'CLRM', ['AX', 'BU', 'FY', 'DH', 'IL', 'MW', 'VP'], 'A' * 1600),
+    (('I', 'IV', 'V'), 'B', 'FJN', 'AOA', ['AL', 'CT', 'FN', 'OY'], 'A'),
+    ]
+
+def reference(rotors, rf, pos, ring, cables):
+    if len(rotors) == 4:
+        return enigma.Enigma4(*rotors, rf, pos, ring, cables)
+    return enigma.Enigma(*rotors, rf, pos, ring, cables)
+
+def compiled_machine(rotors, rf, pos, ring, cables):
+    if len(rotors) == 4:
+        return compiled.CompiledEnigma4(*rotors, rf, pos, ring, cables)
+    return compiled.CompiledEnigma(*rotors, rf, pos, ring, cables)
+
+ENGINES = {
+    'reference': reference,
+    'compiled': compiled_machine,
+    'state': compiled.machine_state,
+    }
+
+# engines that translate a whole text for a key without a machine object
+def keystream_export(rotors, rf, pos, ring, cables, text):
+    return keystream.export(rotors, rf, len(text), pos, ring, cables).translate(text)
+
+def translate_at(rotors, rf, pos, ring, cables, text):
+    # the second half first, so the machine really seeks
+    m = compiled_machine(rotors, rf, pos, ring, cables)
+    half = len(text) // 2
+    tail = m.translateAt(text[half:], half)
+    return m.translateAt(text[:half], 0) + tail
+
+def encrypt_long(rotors, rf, pos, ring, cables, text):
+    # small segments so even the short vectors are split
+    return batch.encrypt_long(text, (rotors, rf, pos, ring, cables), processes=2, size=97)
+
+TEXT_ENGINES = {
+    'keystream': keystream_export,
+    'translateAt': translate_at,
+    'encrypt_long': encrypt_long,
+    }
+
+def best(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+def check():
+    results = {}
+    for name, make in ENGINES.items():
+        ok = True
+        for rotors, rf, pos, ring, cables, text in VECTORS:
+            want = reference(rotors, rf, pos, ring, cables).translate(text)
+            ok = ok and make(rotors, rf, pos, ring, cables).translate(text) == want
+        results[name] = ok
+    for name, translate in TEXT_ENGINES.items():
+        results[name] = all(translate(*v) == reference(*v[:5]).translate(v[5]) for v in VECTORS)
+    keys = [v[:5] for v in VECTORS]
+    texts = [v[5] for v in VECTORS]
+    results['batch'] = batch.encrypt_batch(texts, keys) == \
+        [reference(*k).translate(t) for k, t in zip(keys, texts)]
+    return results
+
+def translate_rates(length):
+    text = 'A' * length
+    rates = {}
+    for name, make in ENGINES.items():
+        for key in (VECTORS[3], VECTORS[5]):
+            machine = key[0]
+            m = make(*key[:5])
+            start = m.getPosition()
+            def run():
+                m.setPosition(start)
+                m.translate(text)
+            run()
+            rates[f'{name}/{len(machine)}rotor'] = length / best(run)
+    return rates
+
+def construction_costs(count):
+    key = VECTORS[6][:5]
+    costs = {}
+    costs['Enigma'] = best(lambda: [reference(*key) for _ in range(count)]) / count
+    costs['CompiledEnigma'] = best(lambda: [compiled_machine(*key) for _ in range(count)]) / count
+    costs['machine_state'] = best(lambda: [compiled.machine_state(*key) for _ in range(count)]) / count
+    state = compiled.machine_state(*key)
+    costs['MachineState.clone'] = best(lambda: [state.clone() for _ in range(count)]) / count
+    return costs
+
+def plugboard_costs(count):
+    pb = plugboard.Plugboard(['AB', 'CD', 'EF', 'GH', 'IJ', 'KL', 'MN', 'OP', 'QR'])
+    def toggle():
+        for _ in range(count):
+            pb.addCable('ST')
+            pb.removeCable('ST')
+    return {'addCable+removeCable': best(toggle) / count}
+
+def search_rates(rings):
+    # find_key style: fixed position and cables, search ring settings
+    order, rf, pos, cables = ('I', 'IV', 'V'), 'B', 'GTO', ['AL', 'CT', 'FN', 'IY']
+    plain = 'A' * 10
+    cipher = compiled.CompiledEnigma('V', 'IV', 'I', 'B', pos, 'FOD', cables).translate(plain)
+    candidates = [enigma.rotor.ALPHA[i // 676] + enigma.rotor.ALPHA[i // 26 % 26] + enigma.rotor.ALPHA[i % 26]
+                  for i in range(rings)]
+
+    def slow():
+        for ring in candidates:
+            enigma.Enigma(*order, rf, pos, ring, cables).match(plain, cipher)
+
+    data = compiled.get_scrambler(order, compiled.reflector_perm(rf)).data
+    matcher = compiled.CribMatcher(plain, cipher, cables)
+    def fast():
+        states = stepping.Stepping(*order, pos).positions(len(plain))
+        for ring in candidates:
+            matcher.matchRing(data, states, [ord(r) - compiled.A for r in ring])
+
+    return {'Enigma.match': rings / best(slow, 1), 'CribMatcher': rings / best(fast)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cipher engines and search loops.')
+    parser.add_argument('-o', '--output', help='write JSON here instead of stdout')
+    parser.add_argument('--quick', action='store_true', help='smaller workloads')
+    args = parser.parse_args()
+    scale = 1 if args.quick else 10
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.time(),
+        'compatible': check(),
+        'chars_per_sec': translate_rates(2000 * scale),
+        'construct_sec': construction_costs(200 * scale),
+        'plugboard_sec': plugboard_costs(500 * scale),
+        'keys_per_sec': search_rates(500 * scale),
+        }
+
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(out + '\n')
+    else:
+        print(out)
+    return 0 if all(report['compatible'].values()) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import collections
+import itertools
+import multiprocessing
+import string
+
+import compiled
+
+class BombeError(Exception): pass
+
+ALPHA = string.ascii_uppercase
+A = ord('A')
+FULL = (1 << 26) - 1
+
+Stop = collections.namedtuple('Stop', 'rotors rf pos cables')
+
+class Menu(object):
+    # Letter pair graph of a crib against the ciphertext.  Each edge joins a
+    # crib letter and its cipher letter through the scrambler at that
+    # position; only the connected component with the most loops is kept.
+    def __init__(self, crib, cipher, offset=0):
+        cipher = cipher[offset:offset + len(crib)]
+        if len(cipher) < len(crib):
+            raise BombeError('cipher shorter than crib')
+        edges = []
+        for i, (p, c) in enumerate(zip(crib, cipher)):
+            if p == c:
+                raise BombeError(f'{p} cannot encrypt to itself at position {offset + i}')
+            edges.append((ord(p) - A, ord(c) - A, offset + i))
+
+        parent = list(range(26))
+        def find(x):
+            while parent[x] != x:
+                x = parent[x]
+            return x
+        for a, b, _ in edges:
+            parent[find(a)] = find(b)
+
+        groups = collections.defaultdict(list)
+        for edge in edges:
+            groups[find(edge[0])].append(edge)
+        def loops(group):
+            letters = {x for a, b, _ in group for x in (a, b)}
+            return len(group) - len(letters) + 1
+        self.edges = max(groups.values(), key=lambda g: (loops(g), len(g)))
+
+        degree = collections.Counter(x for a, b, _ in self.edges for x in (a, b))
+        self.letters = sorted(degree)
+        self.test = degree.most_common(1)[0][0]
+
+    def loops(self):
+        return len(self.edges) - len(self.letters) + 1
+
+class Bombe(object):
+    def __init__(self, menu):
+        self.menu = menu
+
+    def scramblers(self, data, pos):
+        # the bombe assumes only the right rotor moves during the menu
+        o1, o2, o3 = pos
+        adjacent = [[] for _ in range(26)]
+        for a, b, i in self.menu.edges:
+            o = (o1 * 26 + o2) * 26 + (o3 + i + 1) % 26
+            perm = data[o * 26:o * 26 + 26]
+            adjacent[a].append((b, perm))
+            adjacent[b].append((a, perm))
+        return adjacent
+
+    def closure(self, adjacent, letter, guess):
+        # live[x] bit y means "x is steckered to y"; the diagonal board makes
+        # every hypothesis symmetric
+        live = [0] * 26
+        test = self.menu.test
+        stack = [(letter, guess)]
+        while stack:
+            x, y = stack.pop()
+            if live[x] >> y & 1:
+                continue
+            live[x] |= 1 << y
+            if live[test] == FULL:
+                break
+            stack.append((y, x))
+            for z, perm in adjacent[x]:
+                stack.append((z, perm[y]))
+        return live
+
+    def test(self, adjacent):
+        test = self.menu.test
+        live = self.closure(adjacent, test, 0)
+        if live[test] == FULL:
+            return None
+        guesses = [0] if live[test] == 1 else [y for y in range(26) if not live[test] >> y & 1]
+        for y in guesses:
+            live = self.closure(adjacent, test, y)
+            if all(bits & (bits - 1) == 0 for bits in live):
+                cables = []
+                for x, bits in enumerate(live):
+                    z = bits.bit_length() - 1
+                    if x < z:
+                        cables.append(ALPHA[x] + ALPHA[z])
+                return cables
+        return None
+
+    def stops(self, order, rf, left=None):
+        data = compiled.get_scrambler(order, compiled.reflector_perm(rf)).data
+        lefts = range(26) if left is None else [ord(left) - A]
+        for pos in itertools.product(lefts, range(26), range(26)):
+            cables = self.test(self.scramblers(data, pos))
+            if cables is not None:
+                yield Stop(order, rf, ''.join(ALPHA[p] for p in pos), cables)
+
+def _run_shard(args):
+    menu, order, rf, left = args
+    return list(Bombe(menu).stops(order, rf, left))
+
+def run(menu, rotors, reflectors=('B',), processes=None):
+    # stop positions are reported with the ring setting at 'AAA'
+    jobs = ((menu, order, rf, left)
+            for order in itertools.permutations(rotors, 3)
+            for rf in reflectors
+            for left in ALPHA)
+    with multiprocessing.Pool(processes) as pool:
+        for stops in pool.imap_unordered(_run_shard, jobs):
+            yield from stops
+
+if __name__ == '__main__':
+    import unittest
+
+    class TestBombe(unittest.TestCase):
+
+        cables = ['AQ', 'BJ', 'CU', 'DL', 'EG', 'FZ', 'HM', 'IX', 'KV', 'NR']
+        crib = 'WETTERVORHERSAGEBISKAYA'
+
+        def cipher(self):
+            e = compiled.CompiledEnigma('I', 'II', 'III', 'B', 'DKW', cables=self.cables)
+            return e.translate(self.crib)
+
+        def test_menu(self):
+            m = Menu(self.crib, self.cipher())
+            self.assertGreaterEqual(m.loops(), 1)
+            self.assertIn(m.test, m.letters)
+            self.assertRaises(BombeError, Menu, 'AB', 'AC')
+            self.assertRaises(BombeError, Menu, 'AB', 'C')
+
+        def test_stop(self):
+            b = Bombe(Menu(self.crib, self.cipher()))
+            stops = list(b.stops(('I', 'II', 'III'), 'B', 'D'))
+            found = [s for s in stops if s.pos == 'DKW']
+            self.assertEqual(len(found), 1)
+            for cable in found[0].cables:
+                self.assertTrue(cable in self.cables or cable[::-1] in self.cables)
+
+    unittest.main()
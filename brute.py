@@ -2,9 +2,12 @@ import string
 import random
 
 import enigma
+import search
+import stats
 
 #ROTORS = ('I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII')
 ROTORS = ('I', 'IV', 'V')
+GREEKS = ('Beta', 'Gamma')
 
 def random_rotors():
     all = list(ROTORS)
@@ -47,23 +50,34 @@ def create_random_enigma(r1=None, r2=None, r3=None, rf=None, pos=None, ring=None
 
     return e
 
-def find_key(pos, cables, plain, cipher):
-    for r1 in ROTORS:
-        for r2 in ROTORS:
-            if r2 == r1:
-                continue
-            for r3 in ROTORS:
-                if r3 in (r1, r2):
-                    continue
-                #for rf in ('B', 'C'):
-                for rf in ('B', ):
-                    for ring1 in string.ascii_uppercase:
-                        for ring2 in string.ascii_uppercase:
-                            for ring3 in string.ascii_uppercase:
-                                ring = ring1 + ring2 + ring3
-                                e = enigma.Enigma(r1, r2, r3, rf, pos, ring, cables)
-                                if e.match(plain, cipher):
-                                    print(r1, r2, r3, rf, ring)
+# With stats_path the search drivers save the counters and timings of the
+# search as JSON.
+
+def find_key(pos, cables, plain, cipher, processes=None, index=None, stats_path=None):
+    # an index from cribindex.build_index for this crib and plugboard
+    # answers without searching
+    with stats.record(stats_path):
+        if index is not None:
+            index.check(plain, cables)
+            keys = index.lookup(cipher, pos)
+        else:
+            #keys = search.search_offsets(plain, cipher, ROTORS, ('B', 'C'), pos, cables, processes)
+            keys = search.search_offsets(plain, cipher, ROTORS, ('B', ), pos, cables, processes)
+        for key in keys:
+            print(*key.rotors, key.rf, key.ring)
+
+def find_key4(pos, cables, plain, cipher, processes=None, stats_path=None):
+    # M4: four letter pos, greek wheel in front and a thin reflector
+    with stats.record(stats_path):
+        for key in search.search_offsets(plain, cipher, ROTORS, ('BThin', 'CThin'), pos, cables, processes,
+                                         greeks=GREEKS):
+            print(*key.rotors, key.rf, key.ring)
+
+def drag_key(pos, cables, crib, cipher, processes=None, stats_path=None):
+    # the crib may sit anywhere in the cipher
+    with stats.record(stats_path):
+        for offset, key in search.drag(crib, cipher, ROTORS, ('B', ), pos, cables, processes):
+            print(offset, *key.rotors, key.rf, key.ring)
 
 def trial():
     #random.seed(2)
@@ -96,6 +110,16 @@ def brute():
 
     p = 'A' * len(c)
     find_key('GTO', cables, p, c)
+    #find_key('GTO', cables, p, c, stats_path='brute-stats.json')
+
+    #drag_key('GTO', cables, 'WETTERBERICHT', 'PMCZDOLYHJHXTIWJQFJG')
+
+    # M4 output from typing A's
+    #find_key4('CGTO', cables, 'A' * 12, 'VCGXCPPFZOHE')
+
+    #import cribindex
+    #index = cribindex.build_index(p, ROTORS, ('B', ), cables)
+    #find_key('GTO', cables, p, c, index=index)
 
 if __name__ == '__main__':
     #trial()
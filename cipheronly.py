@@ -0,0 +1,209 @@
+import array
+import collections
+import heapq
+import itertools
+import math
+import multiprocessing
+import string
+
+import batch
+import compiled
+import plugopt
+import stepping
+
+class NGramError(Exception): pass
+
+ALPHA = string.ascii_uppercase
+A = ord('A')
+MAGIC = b'NGRM'
+
+Solution = collections.namedtuple('Solution', 'score key plain')
+
+class NGrams(object):
+    # log10 probabilities for every n-gram, indexed as a base-26 number
+    def __init__(self, n, table):
+        if len(table) != 26 ** n:
+            raise NGramError(f'need {26 ** n} entries for {n}-grams')
+        self.n = n
+        self.table = table
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(MAGIC + bytes([self.n]))
+            self.table.tofile(f)
+
+    def score(self, indices):
+        t = self.table
+        if self.n == 2:
+            return sum(t[a * 26 + b] for a, b in zip(indices, indices[1:]))
+        total = 0.0
+        mod = 26 ** self.n
+        index = 0
+        for i, x in enumerate(indices):
+            index = (index * 26 + x) % mod
+            if i >= self.n - 1:
+                total += t[index]
+        return total
+
+def build_ngrams(text, n):
+    counts = [0] * 26 ** n
+    letters = [ord(c) - A for c in text.upper() if c in ALPHA]
+    for i in range(len(letters) - n + 1):
+        index = 0
+        for x in letters[i:i + n]:
+            index = index * 26 + x
+        counts[index] += 1
+    total = sum(counts) + 0.5 * len(counts)
+    return NGrams(n, array.array('f', (math.log10((c + 0.5) / total) for c in counts)))
+
+def load_ngrams(path):
+    with open(path, 'rb') as f:
+        header = f.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise NGramError(f'{path} is not an n-gram table')
+        table = array.array('f')
+        table.frombytes(f.read())
+    return NGrams(header[-1], table)
+
+def index_of_coincidence(indices):
+    n = len(indices)
+    counts = [indices.count(i) for i in range(26)]
+    return sum(c * (c - 1) for c in counts) / (n * (n - 1))
+
+def decrypt(data, states, ring, plug, cipher):
+    rl, rm, rr = ring
+    return bytes(plug[data[(((s // 676 - rl) % 26 * 26 + (s // 26 - rm) % 26) * 26 + (s - rr) % 26) * 26 + plug[c]]]
+                 for s, c in zip(states, cipher))
+
+def encode(text):
+    return bytes(ord(c) - A for c in text)
+
+def cables_of(plug):
+    return [ALPHA[a] + ALPHA[b] for a, b in enumerate(plug) if a < b]
+
+def _rank_shard(args):
+    # phase 1: index of coincidence for every start position with an empty
+    # plugboard and ring 'AAA'.  The left rotor never affects stepping, so
+    # the scrambler indices are worked out once per middle and right start
+    # and each left start reads them from the data rotated by that offset.
+    order, rf, cipher, top = args
+    data = compiled.get_scrambler(order, compiled.reflector_perm(rf)).data
+    starts = []
+    for m0, r0 in itertools.product(range(26), repeat=2):
+        states = stepping.Stepping(*order, 'A' + ALPHA[m0] + ALPHA[r0]).positions(len(cipher))
+        starts.append((ALPHA[m0] + ALPHA[r0], array.array('I', (s * 26 + c for s, c in zip(states, cipher)))))
+    best = []
+    for left in range(26):
+        rotated = data[left * 17576:] + data[:left * 17576]
+        for pos, index in starts:
+            ic = index_of_coincidence(bytes(map(rotated.__getitem__, index)))
+            if len(best) < top:
+                heapq.heappush(best, (ic, ALPHA[left] + pos))
+            else:
+                heapq.heappushpop(best, (ic, ALPHA[left] + pos))
+    return [(ic, order, rf, pos) for ic, pos in best]
+
+def climb(data, states, ring, cipher, ngrams, plug=None):
+    # phase 2: add, remove or exchange one cable at a time while the score
+    # improves
+    opt = plugopt.PlugboardOptimizer(data, compiled.ring_offsets(states, ring), cipher, ngrams, plug)
+    return opt.climb()
+
+def _solve_candidate(args):
+    order, rf, pos, cipher, ngrams = args
+    data = compiled.get_scrambler(order, compiled.reflector_perm(rf)).data
+    states = stepping.Stepping(*order, pos).positions(len(cipher))
+    score, plug = climb(data, states, (0, 0, 0), cipher, ngrams)
+
+    # phase 3: move the middle and right rings together with the positions,
+    # which keeps the offsets and only changes where the turnovers fall
+    best = (score, pos, 'AAA')
+    for r2, r3 in itertools.product(range(26), repeat=2):
+        p = pos[0] + ALPHA[(ord(pos[1]) - A + r2) % 26] + ALPHA[(ord(pos[2]) - A + r3) % 26]
+        states = stepping.Stepping(*order, p).positions(len(cipher))
+        score = ngrams.score(decrypt(data, states, (0, r2, r3), plug, cipher))
+        if score > best[0]:
+            best = (score, p, 'A' + ALPHA[r2] + ALPHA[r3])
+    score, pos, ring = best
+    states = stepping.Stepping(*order, pos).positions(len(cipher))
+    score, plug = climb(data, states, (0, ord(ring[1]) - A, ord(ring[2]) - A), cipher, ngrams, plug)
+    key = batch.Key(order, rf, pos, ring, cables_of(plug))
+    return Solution(score, key, compiled.CompiledEnigma(*order, rf, pos, ring, key.cables).translate(
+        ''.join(ALPHA[c] for c in cipher)))
+
+def rank(cipher, rotors, reflectors=('B',), top=100, processes=None):
+    cipher = encode(cipher)
+    jobs = [(order, rf, cipher, top)
+            for order in itertools.permutations(rotors, 3)
+            for rf in reflectors]
+    with multiprocessing.Pool(processes) as pool:
+        ranked = [r for shard in pool.imap_unordered(_rank_shard, jobs) for r in shard]
+    return heapq.nlargest(top, ranked)
+
+def solve(cipher, rotors, ngrams, reflectors=('B',), top=100, processes=None):
+    candidates = rank(cipher, rotors, reflectors, top, processes)
+    jobs = [(order, rf, pos, encode(cipher), ngrams) for _, order, rf, pos in candidates]
+    with multiprocessing.Pool(processes) as pool:
+        solutions = pool.map(_solve_candidate, jobs)
+    return sorted(solutions, key=lambda s: s.score, reverse=True)
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    import unittest
+
+    TEXT = '''
+        It was the best of times, it was the worst of times, it was the age of wisdom, it was
+        the age of foolishness, it was the epoch of belief, it was the epoch of incredulity, it
+        was the season of light, it was the season of darkness, it was the spring of hope, it
+        was the winter of despair, we had everything before us, we had nothing before us, we
+        were all going direct to heaven, we were all going direct the other way; in short, the
+        period was so far like the present period, that some of its noisiest authorities
+        insisted on its being received, for good or for evil, in the superlative degree of
+        comparison only. There were a king with a large jaw and a queen with a plain face, on
+        the throne of England; there were a king with a large jaw and a queen with a fair face,
+        on the throne of France. In both countries it was clearer than crystal to the lords of
+        the State preserves of loaves and fishes, that things in general were settled for ever.
+        '''
+
+    class TestCipherOnly(unittest.TestCase):
+
+        def test_ngrams(self):
+            ngrams = build_ngrams(TEXT, 2)
+            self.assertGreater(ngrams.score(encode('THEWORST')), ngrams.score(encode('QXZJVKQW')))
+            with tempfile.TemporaryDirectory() as d:
+                path = os.path.join(d, 'bigrams.bin')
+                ngrams.save(path)
+                loaded = load_ngrams(path)
+                self.assertEqual(loaded.n, 2)
+                self.assertEqual(loaded.table, ngrams.table)
+                with open(path, 'wb') as f:
+                    f.write(b'junk')
+                self.assertRaises(NGramError, load_ngrams, path)
+            trigrams = build_ngrams(TEXT, 3)
+            self.assertGreater(trigrams.score(encode('THEWORST')), trigrams.score(encode('QXZJVKQW')))
+            self.assertRaises(NGramError, NGrams, 2, array.array('f', [0.0]))
+
+        def test_ic(self):
+            self.assertEqual(index_of_coincidence(encode('AAAA')), 1.0)
+            self.assertEqual(index_of_coincidence(encode('ABCD')), 0.0)
+
+        def test_solve_candidate(self):
+            plain = ''.join(c for c in TEXT.upper() if c in ALPHA)
+            key = batch.Key(('I', 'IV', 'V'), 'B', 'CEL', 'ADE', ['AM', 'TR', 'OS'])
+            cipher = batch.make_machine(key).translate(plain)
+            ngrams = build_ngrams(TEXT, 2)
+            # the offsets found by phase 1 are the true ones with ring 'AAA'
+            s = _solve_candidate((key.rotors, key.rf, 'CBH', encode(cipher), ngrams))
+            self.assertEqual(s.plain, plain)
+
+        def test_solve(self):
+            plain = ''.join(c for c in TEXT.upper() if c in ALPHA)
+            key = batch.Key(('I', 'IV', 'V'), 'B', 'CEL', 'ADE', ['AM', 'TR', 'OS'])
+            cipher = batch.make_machine(key).translate(plain)
+            candidates = rank(cipher, key.rotors, top=5, processes=2)
+            self.assertIn((key.rotors, 'B', 'CBH'), [c[1:] for c in candidates])
+            solutions = solve(cipher, key.rotors, build_ngrams(TEXT, 2), top=2, processes=2)
+            self.assertEqual(solutions[0].plain, plain)
+
+    unittest.main()
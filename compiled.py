@@ -0,0 +1,628 @@
+import collections
+import functools
+import operator
+import os
+import re
+import string
+
+import enigma
+import stats
+
+ALPHA = string.ascii_uppercase
+A = ord('A')
+
+IDENTITY = bytes(range(26))
+PAD = bytes(256 - 26)
+LETTERS = ALPHA.encode() + PAD
+NOT_LETTERS = re.compile('[^A-Z]')
+
+def rotor_wiring(name):
+    spec = enigma.rotor.SPECS[name]
+    return spec.wiring, spec.notches
+
+def reflector_perm(name):
+    return bytes(enigma.reflector.SPECS[name].perm)
+
+@functools.lru_cache(maxsize=4096)
+def _plugboard_perm(cables):
+    pb = enigma.plugboard.Plugboard(cables)
+    return bytes(ord(pb.translate(c)) - A for c in ALPHA)
+
+def plugboard_perm(cables):
+    return _plugboard_perm(None if cables is None else tuple(cables))
+
+def rotor_tables(wiring):
+    # forward (right to left) and backward translate tables for every offset
+    fwd = []
+    bwd = []
+    for o in range(26):
+        f = bytes((x + wiring[(x + o) % 26]) % 26 for x in range(26))
+        b = bytearray(26)
+        for x, y in enumerate(f):
+            b[y] = x
+        fwd.append(f + PAD)
+        bwd.append(bytes(b) + PAD)
+    return fwd, bwd
+
+class Scrambler(object):
+    # core permutation (rotors + reflector, no plugboard) for every offset
+    # triple of three stepping rotors; data[o * 26 + x] is the output for
+    # input x where o = o1 * 676 + o2 * 26 + o3 and o? = (position - ring) % 26
+    def __init__(self, rotors, reflector, data=None):
+        self.rotors = tuple(rotors)
+        self.wirings = tuple(rotor_wiring(r)[0] for r in self.rotors)
+        self.reflector = bytes(reflector)
+        self.data = self.build() if data is None else data
+
+    def build(self):
+        tables = [rotor_tables(w) for w in self.wirings]
+        (f1, b1), (f2, b2), (f3, b3) = tables
+        rf = self.reflector + PAD
+        data = []
+        for o1 in range(26):
+            for o2 in range(26):
+                inner = IDENTITY.translate(f2[o2]).translate(f1[o1]).translate(rf)
+                inner = inner.translate(b1[o1]).translate(b2[o2]) + PAD
+                for o3 in range(26):
+                    data.append(IDENTITY.translate(f3[o3]).translate(inner).translate(b3[o3]))
+        return b''.join(data)
+
+    def perm(self, index):
+        return self.data[index * 26:index * 26 + 26]
+
+class TableCache(object):
+    # LRU cache with a byte budget.  Entries are charged their size, which
+    # may grow after insertion, and the least recently used are dropped once
+    # the total is over budget; the newest entry is always kept.
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        self.entries[key] = [value, size]
+        self.size += size
+        self.evict()
+
+    def charge(self, key, size):
+        # False when key is no longer cached
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        entry[1] += size
+        self.size += size
+        self.evict()
+        return True
+
+    def evict(self):
+        while self.size > self.budget and len(self.entries) > 1:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.size, 'budget': self.budget,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+# core scrambler data per rotor order and reflector, and the per-state
+# tables of CompiledMachine per full configuration (rotors, reflector, ring,
+# plugboard), so machines for a hot key share work however they are built.
+# Both are keyed on the rotor wirings, not just the names, so registering a
+# rotor again under an old name cannot hand out stale tables.
+SCRAMBLERS = TableCache(64 << 20)
+MACHINE_TABLES = TableCache(64 << 20)
+TABLE_BYTES = 128
+
+def get_scrambler(rotors, reflector):
+    rotors = tuple(rotors)
+    reflector = bytes(reflector)
+    key = (rotors, tuple(rotor_wiring(r)[0] for r in rotors), reflector)
+    s = SCRAMBLERS.get(key)
+    if s is None:
+        directory = os.environ.get('EMUCRYPT_CACHE')
+        if directory:
+            import tablecache
+            s = tablecache.open_scrambler(rotors, reflector, directory)
+        else:
+            s = Scrambler(rotors, reflector)
+        SCRAMBLERS.put(key, s, len(s.data))
+    return s
+
+def cache_stats():
+    return {'scramblers': SCRAMBLERS.stats(), 'machines': MACHINE_TABLES.stats(),
+            'rotors': enigma.rotor.tables.cache_info()._asdict()}
+
+def greek_reflector(greek, offset, reflector):
+    # a greek wheel that never steps folds into the reflector
+    fwd, bwd = rotor_tables(rotor_wiring(greek)[0])
+    return IDENTITY.translate(fwd[offset]).translate(reflector + PAD).translate(bwd[offset])
+
+def scrambler_data(rotors, rf, greek=None):
+    # the greek wheel never steps, so each of its offsets folds into the
+    # reflector and the tables stay the size of a 3 rotor machine
+    reflector = reflector_perm(rf)
+    if greek is not None:
+        reflector = greek_reflector(rotors[0], greek, reflector)
+    return get_scrambler(rotors[-3:], reflector).data
+
+def key_data(rotors, rf, pos=None, ring=None):
+    # scrambler data for a 3 or 4 rotor key with the start position and the
+    # ring offsets of its three stepping rotors
+    pos = 'A' * len(rotors) if pos is None else pos
+    ring = [0] * len(rotors) if ring is None else [ord(r) - A for r in ring]
+    greek = (ord(pos[0]) - A - ring[0]) % 26 if len(rotors) == 4 else None
+    return scrambler_data(rotors, rf, greek), pos[-3:], tuple(ring[-3:])
+
+def pass_through(translate, data_in):
+    # like the reference machine, characters outside A-Z still step the
+    # rotors but come out unchanged
+    data_out = translate(NOT_LETTERS.sub('A', data_in))
+    return ''.join(o if 'A' <= c <= 'Z' else c for c, o in zip(data_in, data_out))
+
+def ring_offsets(states, ring):
+    rl, rm, rr = ring
+    return [((s // 676 - rl) % 26 * 26 + (s // 26 - rm) % 26) * 26 + (s - rr) % 26 for s in states]
+
+class CribMatcher(object):
+    # The plugboard is an involution, so cipher = P(S(P(plain))) is checked
+    # as P(cipher) == S(P(plain)) with both sides encoded once up front.
+    def __init__(self, plain, cipher, cables=None):
+        if len(cipher) < len(plain):
+            raise ValueError('cipher shorter than crib')
+        plug = plugboard_perm(cables)
+        self.plain = bytes(plug[ord(c) - A] for c in plain)
+        self.cipher = bytes(plug[ord(c) - A] for c in cipher[:len(plain)])
+
+    def match(self, data, offsets):
+        for o, x, y in zip(offsets, self.plain, self.cipher):
+            if data[o * 26 + x] != y:
+                return False
+        return True
+
+    def matchRing(self, data, states, ring):
+        rl, rm, rr = ring
+        for s, x, y in zip(states, self.plain, self.cipher):
+            o = ((s // 676 - rl) % 26 * 26 + (s // 26 - rm) % 26) * 26 + (s - rr) % 26
+            if data[o * 26 + x] != y:
+                return False
+        return True
+
+class CompiledMachine(object):
+    def __init__(self, rotors, reflector, pos, ring, cables):
+        names = tuple(rotors[-3:])
+        self.notches = [frozenset(rotor_wiring(r)[1]) for r in names]
+        self.position = [0, 0, 0]
+        self.start = 'AAA'
+        self.stepping = None
+        self.ring = [0, 0, 0]
+        self.plug = plugboard_perm(cables)
+        self.scrambler = get_scrambler(names, reflector)
+        if pos is not None:
+            self.setPosition(pos)
+        if ring is not None:
+            self.setRing(ring)
+        else:
+            self.loadTables()
+
+    def getPosition(self):
+        return ''.join(chr(A + p) for p in self.position)
+
+    def setPosition(self, pos):
+        self.position = [ord(p) - A for p in pos[-3:]]
+        self.start = pos[-3:]
+        self.stepping = None
+
+    def seek(self, offset):
+        # rotor positions after offset keystrokes from the last set position
+        if offset < 0:
+            raise ValueError('negative offset')
+        if self.stepping is None:
+            import stepping
+            self.stepping = stepping.Stepping(*self.scrambler.rotors, self.start)
+        state = self.stepping.state(offset)
+        self.position = [state // 676, state // 26 % 26, state % 26]
+
+    def translateAt(self, data_in, offset):
+        # translate a slice of a message that starts at the last set position
+        self.seek(offset)
+        return self.translate(data_in)
+
+    def setRing(self, ring):
+        self.ring = [ord(r) - A for r in ring[-3:]]
+        self.loadTables()
+
+    def loadTables(self):
+        self.config = (self.scrambler.rotors, self.scrambler.wirings, self.scrambler.reflector,
+                       tuple(self.ring), self.plug)
+        self.tables = MACHINE_TABLES.get(self.config)
+        if self.tables is None:
+            self.tables = {}
+            MACHINE_TABLES.put(self.config, self.tables, 0)
+
+    def compile(self, state):
+        l, m, r = state // 676, state // 26 % 26, state % 26
+        rl, rm, rr = self.ring
+        o = ((l - rl) % 26 * 26 + (m - rm) % 26) * 26 + (r - rr) % 26
+        core = self.scrambler.perm(o)
+        if self.plug != IDENTITY:
+            core = bytes(operator.itemgetter(*self.plug)(core)).translate(self.plug + PAD)
+        table = self.tables[state] = core.translate(LETTERS).decode()
+        if not MACHINE_TABLES.charge(self.config, TABLE_BYTES):
+            # evicted while this machine kept compiling into it, so it goes
+            # back under the budget rather than growing outside it
+            MACHINE_TABLES.put(self.config, self.tables, len(self.tables) * TABLE_BYTES)
+        stats.count('compiled_states')
+        return table
+
+    def translate(self, data_in):
+        if NOT_LETTERS.search(data_in):
+            return pass_through(self.translate, data_in)
+        if stats.ENABLED:
+            stats.count('chars', len(data_in))
+        tables = self.tables
+        _, n2, n3 = self.notches
+        l, m, r = self.position
+        data_out = []
+        for c in data_in:
+            if m in n2:
+                m = (m + 1) % 26
+                l = (l + 1) % 26
+            elif r in n3:
+                m = (m + 1) % 26
+            r = (r + 1) % 26
+
+            state = (l * 26 + m) * 26 + r
+            table = tables.get(state)
+            if table is None:
+                table = self.compile(state)
+            data_out.append(table[ord(c) - A])
+        self.position = [l, m, r]
+        return ''.join(data_out)
+
+    def match(self, plain, cipher):
+        # like translate(plain) == cipher[:len(plain)] but stops stepping at
+        # the first mismatch and builds no output string
+        if len(cipher) < len(plain):
+            raise ValueError('cipher shorter than crib')
+        tables = self.tables
+        _, n2, n3 = self.notches
+        l, m, r = self.position
+        for p, c in zip(plain, cipher):
+            if m in n2:
+                m = (m + 1) % 26
+                l = (l + 1) % 26
+            elif r in n3:
+                m = (m + 1) % 26
+            r = (r + 1) % 26
+
+            state = (l * 26 + m) * 26 + r
+            table = tables.get(state)
+            if table is None:
+                table = self.compile(state)
+            if table[ord(p) - A] != c:
+                self.position = [l, m, r]
+                return False
+        self.position = [l, m, r]
+        return True
+
+class CompiledEnigma(CompiledMachine):
+    def __init__(self, r1, r2, r3, rf, pos=None, ring=None, cables=None):
+        super().__init__((r1, r2, r3), reflector_perm(rf), pos, ring, cables)
+
+class CompiledEnigma4(CompiledMachine):
+    def __init__(self, r1, r2, r3, r4, rf, pos=None, ring=None, cables=None):
+        self.greek = r1
+        self.greek_position = 0 if pos is None else ord(pos[0]) - A
+        self.greek_ring = 0 if ring is None else ord(ring[0]) - A
+        self.rf = reflector_perm(rf)
+        super().__init__((r2, r3, r4), self.greekReflector(), pos, ring, cables)
+
+    def greekReflector(self):
+        offset = (self.greek_position - self.greek_ring) % 26
+        return greek_reflector(self.greek, offset, self.rf)
+
+    def getPosition(self):
+        return chr(A + self.greek_position) + super().getPosition()
+
+    def setPosition(self, pos):
+        super().setPosition(pos)
+        greek = ord(pos[0]) - A
+        if greek != self.greek_position:
+            self.greek_position = greek
+            self.scrambler = get_scrambler(self.scrambler.rotors, self.greekReflector())
+            self.loadTables()
+
+    def setRing(self, ring):
+        self.greek_ring = ord(ring[0]) - A
+        self.scrambler = get_scrambler(self.scrambler.rotors, self.greekReflector())
+        super().setRing(ring)
+
+class MachineState(object):
+    # Minimal machine for search inner loops: integer positions and rings
+    # plus references to the shared scrambler data, notches and plugboard.
+    # An M4's greek wheel is folded into the data; its letter is kept only
+    # to report positions like Enigma4.
+    __slots__ = ('data', 'notches', 'plug', 'start', 'ring', 'position', 'greek')
+
+    def __init__(self, data, notches, plug, start, ring, greek=''):
+        self.data = data
+        self.notches = notches
+        self.plug = plug
+        self.start = start
+        self.ring = ring
+        self.position = start
+        self.greek = greek
+
+    def clone(self):
+        return MachineState(self.data, self.notches, self.plug, self.position, self.ring, self.greek)
+
+    def reset(self, start=None):
+        if start is not None:
+            self.start = start
+        self.position = self.start
+
+    def getPosition(self):
+        return self.greek + ''.join(chr(A + p) for p in self.position)
+
+    def setPosition(self, pos):
+        # a greek wheel is folded into the data and cannot move here
+        if len(pos) == 4 and pos[0] != self.greek:
+            raise ValueError(f'cannot move the greek wheel from {self.greek!r} to {pos[0]!r}')
+        self.position = tuple(ord(p) - A for p in pos[-3:])
+
+    def translate(self, data_in):
+        if NOT_LETTERS.search(data_in):
+            return pass_through(self.translate, data_in)
+        if stats.ENABLED:
+            stats.count('chars', len(data_in))
+        data = self.data
+        plug = self.plug
+        n2, n3 = self.notches
+        rl, rm, rr = self.ring
+        l, m, r = self.position
+        data_out = []
+        for c in data_in:
+            if m in n2:
+                m = (m + 1) % 26
+                l = (l + 1) % 26
+            elif r in n3:
+                m = (m + 1) % 26
+            r = (r + 1) % 26
+
+            o = ((l - rl) % 26 * 26 + (m - rm) % 26) * 26 + (r - rr) % 26
+            data_out.append(ALPHA[plug[data[o * 26 + plug[ord(c) - A]]]])
+        self.position = (l, m, r)
+        return ''.join(data_out)
+
+def machine_state(rotors, rf, pos=None, ring=None, cables=None):
+    data, start, ring = key_data(rotors, rf, pos, ring)
+    notches = tuple(frozenset(rotor_wiring(r)[1]) for r in rotors[-2:])
+    greek = (pos or 'A')[0] if len(rotors) == 4 else ''
+    return MachineState(data, notches, plugboard_perm(cables), tuple(ord(p) - A for p in start), ring, greek)
+
+if __name__ == '__main__':
+    import unittest
+
+    import stepping
+
+    class TestCompiled(unittest.TestCase):
+
+        def assertSame(self, e, c, data):
+            self.assertEqual(e.translate(data), c.translate(data))
+            self.assertEqual(e.getPosition(), c.getPosition())
+
+        def test_Position(self):
+            c = CompiledEnigma('III', 'IV', 'V', 'B', 'AJD')
+            self.assertEqual(c.translate('A'), 'P')
+            self.assertEqual(c.getPosition(), 'BKE')
+            c.setPosition('QIY')
+            self.assertEqual(c.translate('AAAAA'), 'DELFD')
+            self.assertEqual(c.getPosition(), 'RKD')
+
+        def test_Ring(self):
+            args = ('VIII', 'VII', 'VI', 'C')
+            self.assertSame(enigma.Enigma(*args, ring='VGI'),
+                            CompiledEnigma(*args, ring='VGI'), 'A' * 1000)
+
+        def test_Plugboard(self):
+            args = ('V', 'II', 'IV', 'C')
+            cables = ['AB', 'QZ', 'LM', 'OE', 'NC', 'TW']
+            self.assertSame(enigma.Enigma(*args, cables=cables),
+                            CompiledEnigma(*args, cables=cables), 'A' * 1000)
+
+        def test_translate(self):
+            c = CompiledEnigma('I', 'II', 'III', 'B')
+            self.assertEqual(c.translate('A' * 20), 'BDZGOWCXLTKSBTMCDLPB')
+
+        def test_pass_through(self):
+            args = ('I', 'IV', 'V', 'B', 'FJN', 'AOA', ['AL', 'CT', 'FN', 'OY'])
+            text = 'Hello World, HELLO WORLD @[\\]^ \u00e9\u4e16!'
+            self.assertSame(enigma.Enigma(*args), CompiledEnigma(*args), text)
+            self.assertSame(enigma.Enigma(*args), machine_state(args[:3], *args[3:]), text)
+            self.assertEqual(CompiledEnigma(*args).translate(''), '')
+
+        def test_text(self):
+            args = ('I', 'IV', 'V', 'B', 'FJN', 'AOA', ['AL', 'CT', 'FN', 'OY'])
+            text = 'THEQUICKBROWNFOXJUMPSOVERTHELAZYDOG' * 30
+            self.assertSame(enigma.Enigma(*args), CompiledEnigma(*args), text)
+
+        def test_setPosition(self):
+            e = enigma.Enigma('I', 'IV', 'V', 'B', ring='AOA')
+            c = CompiledEnigma('I', 'IV', 'V', 'B', ring='AOA')
+            for pos in ('AAA', 'GJO', 'QDV', 'ZZZ'):
+                e.setPosition(pos)
+                c.setPosition(pos)
+                self.assertSame(e, c, 'HELLOWORLD' * 10)
+
+        def test_4rotor(self):
+            cables = ['AX', 'BU', 'FY', 'DH', 'IL', 'MW', 'VP']
+            e = enigma.Enigma4('Gamma', 'VI', 'VII', 'IV', 'CThin', cables=cables)
+            c = CompiledEnigma4('Gamma', 'VI', 'VII', 'IV', 'CThin', cables=cables)
+            for m in (e, c):
+                m.setPosition('QKTE')
+                m.setRing('CLRM')
+            self.assertSame(e, c, 'A' * 1600)
+
+        def test_4rotor_as_3rotor(self):
+            e3 = CompiledEnigma('I', 'II', 'III', 'B')
+            e4 = CompiledEnigma4('Beta', 'I', 'II', 'III', 'BThin')
+            c = 'A' * 1600
+            self.assertEqual(e3.translate(c), e4.translate(c))
+
+        def test_match(self):
+            p = 'A' * 100
+            c = enigma.Enigma('I', 'II', 'III', 'B').translate(p)
+            self.assertTrue(CompiledEnigma('I', 'II', 'III', 'B').match(p, c))
+            self.assertFalse(CompiledEnigma('I', 'II', 'III', 'C').match(p, c))
+            m = CompiledEnigma('I', 'II', 'III', 'B')
+            self.assertFalse(m.match(p, 'BDZX' + c[4:]))
+            self.assertEqual(m.getPosition(), 'AAE')
+            self.assertRaises(ValueError, m.match, p, c[:10])
+
+        def test_CribMatcher(self):
+            cables = ['AL', 'CT', 'FN', 'OY']
+            p = 'WETTERBERICHT'
+            c = CompiledEnigma('I', 'IV', 'V', 'B', 'FJN', 'AOA', cables).translate(p)
+            m = CribMatcher(p, c, cables)
+            data = get_scrambler(('I', 'IV', 'V'), reflector_perm('B')).data
+            states = stepping.Stepping('I', 'IV', 'V', 'FJN').positions(len(p))
+            self.assertTrue(m.matchRing(data, states, (0, 14, 0)))
+            self.assertFalse(m.matchRing(data, states, (0, 14, 1)))
+            offsets = [s // 676 * 676 + (s // 26 - 14) % 26 * 26 + s % 26 for s in states]
+            self.assertTrue(m.match(data, offsets))
+            self.assertFalse(CribMatcher(p, c).match(data, offsets))
+            self.assertRaises(ValueError, CribMatcher, p, c[:3])
+
+        def test_MachineState(self):
+            args = ('I', 'IV', 'V'), 'B', 'FJN', 'AOA', ['AL', 'CT', 'FN', 'OY']
+            m = machine_state(*args)
+            text = 'THEQUICKBROWNFOXJUMPSOVERTHELAZYDOG' * 30
+            self.assertSame(enigma.Enigma(*args[0], *args[1:]), m, text)
+            clone = m.clone()
+            self.assertEqual(m.translate(text), clone.translate(text))
+            m.reset()
+            self.assertEqual(m.getPosition(), 'FJN')
+            m.reset((0, 0, 0))
+            self.assertEqual(m.translate('A'), CompiledEnigma(*args[0], 'B', 'AAA', 'AOA', args[4]).translate('A'))
+            self.assertRaises(AttributeError, setattr, m, 'extra', 1)
+
+        def test_MachineState4(self):
+            cables = ['AX', 'BU', 'FY', 'DH', 'IL', 'MW', 'VP']
+            e = enigma.Enigma4('Gamma', 'VI', 'VII', 'IV', 'CThin', 'QKTE', 'CLRM', cables)
+            m = machine_state(('Gamma', 'VI', 'VII', 'IV'), 'CThin', 'QKTE', 'CLRM', cables)
+            self.assertSame(e, m, 'A' * 1600)
+            self.assertEqual(m.clone().getPosition(), e.getPosition())
+            m.setPosition('QKTE')
+            e.setPosition('QKTE')
+            self.assertSame(e, m, 'A' * 100)
+            m.setPosition('KTE')
+            self.assertEqual(m.getPosition(), 'QKTE')
+            self.assertRaises(ValueError, m.setPosition, 'AKTE')
+
+        def test_seek(self):
+            args = ('I', 'IV', 'V', 'B', 'FJN', 'AOA', ['AL', 'CT', 'FN', 'OY'])
+            text = 'THEQUICKBROWNFOXJUMPSOVERTHELAZYDOG' * 600
+            e = enigma.Enigma(*args)
+            whole = e.translate(text)
+            c = CompiledEnigma(*args)
+            for offset in (0, 1, 5000, 16900, len(text) - 10):
+                self.assertEqual(c.translateAt(text[offset:offset + 40], offset), whole[offset:offset + 40])
+            c.seek(len(text))
+            self.assertEqual(c.getPosition(), e.getPosition())
+            segments = [c.translateAt(text[i:i + 999], i) for i in range(0, len(text), 999)]
+            self.assertEqual(''.join(segments), whole)
+            self.assertRaises(ValueError, c.seek, -1)
+
+        def test_seek4(self):
+            cables = ['AX', 'BU', 'FY', 'DH', 'IL', 'MW', 'VP']
+            whole = enigma.Enigma4('Gamma', 'VI', 'VII', 'IV', 'CThin', 'QKTE', 'CLRM', cables).translate('A' * 1600)
+            c = CompiledEnigma4('Gamma', 'VI', 'VII', 'IV', 'CThin', 'QKTE', 'CLRM', cables)
+            self.assertEqual(c.translateAt('A' * 100, 1234), whole[1234:1334])
+            self.assertEqual(c.getPosition()[0], 'Q')
+
+        def test_TableCache(self):
+            cache = TableCache(100)
+            cache.put('a', 1, 40)
+            cache.put('b', 2, 40)
+            self.assertEqual(cache.get('a'), 1)
+            cache.put('c', 3, 40)
+            self.assertIsNone(cache.get('b'))
+            self.assertTrue(cache.charge('a', 50))
+            self.assertEqual(list(cache.entries), ['c'])
+            self.assertEqual(cache.stats()['evictions'], 2)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            cache.put('d', 4, 1000)
+            self.assertEqual(cache.get('d'), 4)
+            self.assertFalse(cache.charge('a', 10))
+
+        def test_budget(self):
+            global MACHINE_TABLES
+            saved = MACHINE_TABLES
+            MACHINE_TABLES = TableCache(100 * TABLE_BYTES)
+            try:
+                a = CompiledEnigma('I', 'II', 'V', 'B', ring='ABC')
+                b = CompiledEnigma('I', 'II', 'V', 'B', ring='ABD')
+                a.translate('A' * 80)
+                b.translate('A' * 80)
+                self.assertNotIn(a.config, MACHINE_TABLES.entries)
+                a.translate('A' * 10)
+                self.assertIn(a.config, MACHINE_TABLES.entries)
+                self.assertEqual(MACHINE_TABLES.size, len(a.tables) * TABLE_BYTES)
+                self.assertLessEqual(MACHINE_TABLES.size, MACHINE_TABLES.budget)
+            finally:
+                MACHINE_TABLES = saved
+
+        def test_shared_tables(self):
+            args = ('II', 'IV', 'V', 'C', 'FJN', 'ZOA', ['AL', 'CT', 'FN', 'QR'])
+            a = CompiledEnigma(*args)
+            hits = MACHINE_TABLES.hits
+            b = CompiledEnigma(*args[:4], 'AAA', *args[5:])
+            self.assertIs(a.tables, b.tables)
+            self.assertEqual(MACHINE_TABLES.hits, hits + 1)
+            a.translate('A' * 100)
+            self.assertEqual(len(b.tables), 100)
+            self.assertIsNot(CompiledEnigma(*args[:6]).tables, a.tables)
+            b.setRing('AOB')
+            self.assertIsNot(a.tables, b.tables)
+            self.assertIn('rotors', cache_stats())
+
+        def test_register(self):
+            enigma.register_rotor('X', enigma.rotor.SPECS['I'].letters, 'Q')
+            self.assertEqual(CompiledEnigma('X', 'II', 'III', 'B').translate('A' * 10), 'BDZGOWCXLT')
+            enigma.register_rotor('X', enigma.rotor.SPECS['II'].letters, 'E')
+            want = enigma.Enigma('X', 'II', 'III', 'B').translate('A' * 10)
+            self.assertNotEqual(want, 'BDZGOWCXLT')
+            self.assertEqual(CompiledEnigma('X', 'II', 'III', 'B').translate('A' * 10), want)
+            self.assertEqual(machine_state(('X', 'II', 'III'), 'B').translate('A' * 10), want)
+
+        def test_half_double_step(self):
+            c = CompiledEnigma('I', 'IV', 'V', 'B', pos='FJN', ring='AOA', cables=['AL', 'CT', 'FN', 'OY'])
+            self.assertEqual(c.translate('A'), 'B')
+            self.assertEqual(c.getPosition(), 'GKO')
+            c.setPosition('GJO')
+            self.assertEqual(c.translate('A'), 'Q')
+            self.assertEqual(c.getPosition(), 'HKP')
+
+    unittest.main()
@@ -0,0 +1,185 @@
+import array
+import bisect
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import string
+import tempfile
+
+import batch
+import compiled
+import search
+
+class CribIndexError(Exception): pass
+
+ALPHA = string.ascii_uppercase
+A = ord('A')
+MAGIC = b'CRIX'
+MAX_PREFIX = 6
+
+def _index_shard(args):
+    # each entry packs the first k output letters as a base-26 code in the
+    # high 32 bits and pattern number * 17576 + offset index in the low ones
+    order, rf, plain, first = args
+    data = compiled.get_scrambler(order, compiled.reflector_perm(rf)).data
+    k = len(plain)
+    entries = array.array('Q')
+    patterns = search.stepping_patterns(order, k)
+    for g, (deltas, _) in enumerate(patterns, first):
+        steps = [(d // 676, d // 26 % 26, d % 26, x) for d, x in zip(deltas, plain)]
+        for o in range(17576):
+            o1, o2, o3 = o // 676, o // 26 % 26, o % 26
+            code = 0
+            for d1, d2, d3, x in steps:
+                code = code * 26 + data[(((d1 + o1) % 26 * 26 + (d2 + o2) % 26) * 26 + (d3 + o3) % 26) * 26 + x]
+            entries.append(code << 32 | g * 17576 + o)
+    return entries
+
+class CribIndex(object):
+    # Maps the first k letters that a fixed crib encrypts to, for every
+    # rotor order, reflector, stepping pattern and rotor offset, back to the
+    # keys that produce them.  Keys are reported like search.search_offsets.
+    def __init__(self, crib, rotors, reflectors, cables, patterns, entries):
+        self.crib = crib
+        self.rotors = tuple(rotors)
+        self.reflectors = tuple(reflectors)
+        self.cables = None if cables is None else list(cables)
+        self.k = min(len(crib), MAX_PREFIX)
+        self.plug = compiled.plugboard_perm(cables)
+        self.patterns = patterns
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def code(self, cipher):
+        code = 0
+        for c in cipher[:self.k]:
+            code = code * 26 + self.plug[ord(c) - A]
+        return code
+
+    def check(self, plain, cables=None):
+        # an index only answers for the crib and plugboard it was built with
+        if not self.crib.startswith(plain):
+            raise CribIndexError(f'index was built for crib {self.crib!r}, not {plain!r}')
+        if compiled.plugboard_perm(cables) != self.plug:
+            raise CribIndexError(f'index was built for cables {self.cables}, not {cables}')
+
+    def candidates(self, cipher, pos=None):
+        if len(cipher) < self.k:
+            raise CribIndexError(f'need at least {self.k} cipher letters')
+        code = self.code(cipher)
+        lo = bisect.bisect_left(self.entries, code << 32)
+        hi = bisect.bisect_left(self.entries, code + 1 << 32, lo)
+        p1 = 0 if pos is None else ord(pos[0]) - A
+        for entry in self.entries[lo:hi]:
+            g, o = divmod(entry & 0xffffffff, 17576)
+            order, rf, starts = self.patterns[g]
+            o1, o2, o3 = o // 676, o // 26 % 26, o % 26
+            for m0, r0 in starts:
+                if pos is not None and (m0, r0) != (ord(pos[1]) - A, ord(pos[2]) - A):
+                    continue
+                p = ALPHA[p1] + ALPHA[m0] + ALPHA[r0]
+                ring = ALPHA[(p1 - o1) % 26] + ALPHA[(m0 - o2) % 26] + ALPHA[(r0 - o3) % 26]
+                yield batch.Key(tuple(order), rf, p, ring, self.cables)
+
+    def lookup(self, cipher, pos=None):
+        if len(cipher) > len(self.crib):
+            raise CribIndexError('cipher is longer than the indexed crib')
+        keys = list(self.candidates(cipher, pos))
+        if len(cipher) > self.k:
+            plain = self.crib[:len(cipher)]
+            keys = [key for key in keys if batch.make_machine(key).translate(plain) == cipher]
+        return keys
+
+    def save(self, path):
+        header = json.dumps({'crib': self.crib, 'rotors': self.rotors, 'reflectors': self.reflectors,
+                             'cables': self.cables, 'patterns': self.patterns}).encode()
+        header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 8)
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC + len(header).to_bytes(4, 'little') + header)
+            self.entries.tofile(f)
+        os.replace(tmp, path)
+
+def build_index(crib, rotors, reflectors=('B',), cables=None, processes=None):
+    plug = compiled.plugboard_perm(cables)
+    plain = bytes(plug[ord(c) - A] for c in crib[:MAX_PREFIX])
+    jobs = []
+    patterns = []
+    for order in itertools.permutations(rotors, 3):
+        for rf in reflectors:
+            jobs.append((order, rf, plain, len(patterns)))
+            patterns.extend([order, rf, starts] for _, starts in search.stepping_patterns(order, len(plain)))
+    if processes == 1:
+        shards = map(_index_shard, jobs)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            shards = pool.map(_index_shard, jobs)
+    entries = array.array('Q', sorted(itertools.chain.from_iterable(shards)))
+    return CribIndex(crib, rotors, reflectors, cables, patterns, entries)
+
+def load_index(path):
+    # the sorted entries are memory-mapped and searched in place
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise CribIndexError(f'{path} is not a crib index')
+        size = int.from_bytes(f.read(4), 'little')
+        header = json.loads(f.read(size))
+        offset = f.tell()
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    entries = memoryview(data)[offset:].cast('Q')
+    patterns = [(tuple(order), rf, [tuple(s) for s in starts]) for order, rf, starts in header['patterns']]
+    return CribIndex(header['crib'], header['rotors'], header['reflectors'], header['cables'], patterns, entries)
+
+if __name__ == '__main__':
+    import unittest
+
+    class TestCribIndex(unittest.TestCase):
+
+        @classmethod
+        def setUpClass(cls):
+            cls.cables = ['AL', 'CT', 'FN', 'IY']
+            cls.index = build_index('A' * 12, ('I', 'IV', 'V'), cables=cls.cables, processes=1)
+
+        def test_lookup(self):
+            p = 'A' * 10
+            c = compiled.CompiledEnigma('IV', 'I', 'V', 'B', 'GTO', 'QEB', self.cables).translate(p)
+            keys = self.index.lookup(c, 'GTO')
+            self.assertIn(batch.Key(('IV', 'I', 'V'), 'B', 'GTO', 'QEB', self.cables), keys)
+            self.assertEqual(sorted(keys), sorted(search.search_offsets(p, c, ('I', 'IV', 'V'), pos='GTO',
+                                                                        cables=self.cables, processes=1)))
+
+        def test_nopos(self):
+            p = 'A' * 12
+            c = compiled.CompiledEnigma('I', 'IV', 'V', 'B', 'FJN', 'AOA', self.cables).translate(p)
+            keys = self.index.lookup(c)
+            self.assertIn(batch.Key(('I', 'IV', 'V'), 'B', 'AJN', 'VOA', self.cables), keys)
+            for key in keys:
+                self.assertEqual(batch.make_machine(key).translate(p), c)
+
+        def test_errors(self):
+            self.assertRaises(CribIndexError, self.index.lookup, 'ABC')
+            self.assertRaises(CribIndexError, self.index.lookup, 'A' * 13)
+
+        def test_check(self):
+            self.index.check('A' * 10, ['CT', 'LA', 'FN', 'IY'])
+            self.assertRaises(CribIndexError, self.index.check, 'WETTER', self.cables)
+            self.assertRaises(CribIndexError, self.index.check, 'A' * 13, self.cables)
+            self.assertRaises(CribIndexError, self.index.check, 'A' * 10, ['AL', 'CT'])
+            self.assertRaises(CribIndexError, self.index.check, 'A' * 10)
+
+        def test_save(self):
+            c = compiled.CompiledEnigma('V', 'IV', 'I', 'B', 'CMW', 'FOD', self.cables).translate('A' * 8)
+            with tempfile.TemporaryDirectory() as d:
+                path = os.path.join(d, 'aaaa.idx')
+                self.index.save(path)
+                loaded = load_index(path)
+                self.assertEqual(len(loaded), len(self.index))
+                self.assertEqual(loaded.lookup(c, 'CMW'), self.index.lookup(c, 'CMW'))
+                self.assertEqual(loaded.lookup(c), self.index.lookup(c))
+
+    unittest.main()
@@ -1,6 +1,10 @@
+import functools
+import time
+
 import plugboard
 import rotor
 import reflector
+import stats
 
 ROTOR = {
     'I'     : rotor.RotorI,
@@ -22,6 +26,14 @@ REFLECTOR = {
     'CThin' : reflector.ReflectorCThin,
     }
 
+def register_rotor(name, wiring, notches):
+    spec = rotor.register(name, wiring, notches)
+    ROTOR[name] = functools.partial(rotor.Rotor, spec, None)
+
+def register_reflector(name, cables):
+    spec = reflector.register(name, cables)
+    REFLECTOR[name] = functools.partial(reflector.Reflector, spec)
+
 class Enigma(object):
     def __init__(self, r1, r2, r3, rf, pos=None, ring=None, cables=None):
         if pos is None:
@@ -48,6 +60,8 @@ class Enigma(object):
         self.r3.setRing(ring[2])
 
     def translate(self, data_in):
+        if stats.ENABLED:
+            return self.profile(data_in)
         data_out = []
         for c in data_in:
             turnover = self.r3.step()
@@ -68,6 +82,33 @@ class Enigma(object):
 
         return ''.join(data_out)
 
+    def profile(self, data_in):
+        # translate() with every phase timed, used while stats are enabled
+        clock = time.perf_counter_ns
+        data_out = []
+        for c in data_in:
+            t0 = clock()
+            turnover = self.r3.step()
+            turnover = self.r2.step(turnover)
+            self.r1.step(turnover)
+            t1 = clock()
+            p0 = self.pb.translate(c)
+            t2 = clock()
+            p3 = self.r1.rtrans(self.r2.rtrans(self.r3.rtrans(p0)))
+            p4 = self.rf.translate(p3)
+            p7 = self.r3.ltrans(self.r2.ltrans(self.r1.ltrans(p4)))
+            t3 = clock()
+            data_out.append(self.pb.translate(p7))
+            t4 = clock()
+            stats.add_time('step', t1 - t0)
+            stats.add_time('plugboard', t2 - t1 + t4 - t3)
+            stats.add_time('scramble', t3 - t2)
+        t = clock()
+        out = ''.join(data_out)
+        stats.add_time('join', clock() - t)
+        stats.count('chars', len(data_in))
+        return out
+
     def match(self, plain, cipher):
         for i, p in enumerate(plain):
             c = self.translate(p)
@@ -104,6 +145,8 @@ class Enigma4(object):
         self.r4.setRing(ring[3])
 
     def translate(self, data_in):
+        if stats.ENABLED:
+            stats.count('chars', len(data_in))
         data_out = []
         for c in data_in:
             turnover = self.r4.step()
@@ -289,6 +332,31 @@ if __name__ == '__main__':
             self.assertTrue(eB.match(p, c))
             self.assertFalse(eC.match(p, c))
 
+        def test_profile(self):
+            stats.enable()
+            try:
+                e = Enigma('I', 'IV', 'V', 'B', 'FJN', 'AOA', ['AL', 'CT', 'FN', 'OY'])
+                c = e.translate('A' * 50)
+                snap = stats.snapshot(caches=False)
+            finally:
+                stats.enable(False)
+                stats.reset()
+            e.setPosition('FJN')
+            self.assertEqual(e.translate('A' * 50), c)
+            self.assertEqual(snap['counters']['chars'], 50)
+            self.assertEqual(snap['timings']['step']['count'], 50)
+            self.assertEqual(set(snap['timings']), {'step', 'plugboard', 'scramble', 'join'})
+
+        def test_register(self):
+            register_rotor('X', 'EKMFLGDQVZNTOWYHXUSPAIBRCJ', 'Q')
+            register_reflector('X', ('AY', 'BR', 'CU', 'DH', 'EQ', 'FS', 'GL',
+                                     'IP', 'JX', 'KN', 'MO', 'TZ', 'VW'))
+            eA = Enigma('X', 'II', 'III', 'X')
+            eB = Enigma('I', 'II', 'III', 'B')
+            p = 'A' * 1000
+            self.assertEqual(eA.translate(p), eB.translate(p))
+            self.assertRaises(rotor.RotorError, register_rotor, 'Y', 'ABC', '')
+
         def test_half_double_step(self):
             e = Enigma('I', 'IV', 'V', 'B', pos='FJN', ring='AOA', cables=['AL', 'CT', 'FN', 'OY'])
             p = e.translate('A')
@@ -0,0 +1,179 @@
+import itertools
+import json
+import os
+import string
+import tempfile
+
+import batch
+
+class KeySpaceError(Exception): pass
+
+ALPHA = string.ascii_uppercase
+ALL = [''.join(p) for p in itertools.product(ALPHA, repeat=3)]
+
+class KeySpace(object):
+    # Keys are ranked in mixed radix as (rotor order, reflector, position,
+    # ring) with the ring varying fastest, so neighbouring ranks share the
+    # stepping sequence of one start position.
+    def __init__(self, rotors, reflectors=('B',), positions=None, rings=None, cables=None,
+                 prune=False, start=0, stop=None):
+        self.rotors = tuple(rotors)
+        self.reflectors = tuple(reflectors)
+        # the default lists are saved and pickled as None
+        self.all_positions = positions is None
+        self.all_rings = rings is None
+        self.positions = ALL if positions is None else list(positions)
+        self.rings = ALL if rings is None else list(rings)
+        self.cables = None if cables is None else list(cables)
+        self.prune = prune
+        if prune and positions is None:
+            # only position - ring of the left rotor matters, so fix its ring
+            self.rings = [r for r in self.rings if r[0] == 'A']
+        self.orders = list(itertools.permutations(self.rotors, 3))
+        self.size = len(self.orders) * len(self.reflectors) * len(self.positions) * len(self.rings)
+        self.start = start
+        self.stop = self.size if stop is None else stop
+        if not 0 <= self.start <= self.stop <= self.size:
+            raise KeySpaceError(f'bad range {start}:{stop} for {self.size} keys')
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def _copy(self, start, stop):
+        space = object.__new__(KeySpace)
+        space.__dict__.update(self.__dict__)
+        space.start = start
+        space.stop = stop
+        return space
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise KeySpaceError('key space slices must be contiguous')
+            return self._copy(self.start + start, self.start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('key rank out of range')
+        return self.key(self.start + index)
+
+    def key(self, rank):
+        rank, ring = divmod(rank, len(self.rings))
+        rank, pos = divmod(rank, len(self.positions))
+        order, rf = divmod(rank, len(self.reflectors))
+        return batch.Key(self.orders[order], self.reflectors[rf], self.positions[pos],
+                         self.rings[ring], self.cables)
+
+    def rank(self, key):
+        try:
+            rank = self.orders.index(tuple(key.rotors))
+            rank = rank * len(self.reflectors) + self.reflectors.index(key.rf)
+            rank = rank * len(self.positions) + self.positions.index(key.pos)
+            rank = rank * len(self.rings) + self.rings.index(key.ring)
+        except ValueError:
+            raise KeySpaceError(f'{key} is not in this key space')
+        return rank
+
+    def __iter__(self):
+        for rank in range(self.start, self.stop):
+            yield self.key(rank)
+
+    def shards(self, n):
+        bounds = [self.start + len(self) * i // n for i in range(n + 1)]
+        return [self._copy(a, b) for a, b in zip(bounds, bounds[1:])]
+
+    def state(self):
+        return {'rotors': self.rotors, 'reflectors': self.reflectors,
+                'positions': None if self.all_positions else self.positions,
+                'rings': None if self.all_rings else self.rings,
+                'cables': self.cables, 'prune': self.prune,
+                'start': self.start, 'stop': self.stop}
+
+    def __reduce__(self):
+        return from_state, (self.state(),)
+
+def from_state(state):
+    return KeySpace(state['rotors'], state['reflectors'], state['positions'], state['rings'],
+                    state['cables'], state['prune'], state['start'], state['stop'])
+
+class Checkpoint(object):
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, space, rank):
+        # everything in space before rank is done
+        state = space.state()
+        state['start'] = rank
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return from_state(json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+if __name__ == '__main__':
+    import pickle
+    import unittest
+
+    class TestKeySpace(unittest.TestCase):
+
+        def test_len(self):
+            self.assertEqual(len(KeySpace(('I', 'II', 'III'))), 6 * 26 ** 6)
+            self.assertEqual(len(KeySpace(('I', 'II', 'III'), ('B', 'C'), ['AAA'])), 12 * 26 ** 3)
+            self.assertEqual(len(KeySpace(('I', 'II', 'III'), prune=True)), 6 * 26 ** 5)
+            self.assertEqual(len(KeySpace(('I', 'II', 'III'), positions=['AAA'], prune=True)), 6 * 26 ** 3)
+
+        def test_rank(self):
+            space = KeySpace(('I', 'IV', 'V'), ('B', 'C'), ['AAA', 'GTO'], cables=['AL'])
+            for rank in (0, 1, 17575, 17576, 99999, len(space) - 1):
+                self.assertEqual(space.rank(space[rank]), rank)
+            self.assertEqual(space[0], batch.Key(('I', 'IV', 'V'), 'B', 'AAA', 'AAA', ['AL']))
+            self.assertEqual(space[1].ring, 'AAB')
+            self.assertEqual(space[-1], batch.Key(('V', 'IV', 'I'), 'C', 'GTO', 'ZZZ', ['AL']))
+            self.assertRaises(IndexError, space.__getitem__, len(space))
+            self.assertRaises(KeySpaceError, space.rank, batch.Key(('I', 'II', 'III'), 'B', 'AAA', 'AAA'))
+
+        def test_shards(self):
+            space = KeySpace(('I', 'IV', 'V'), positions=['AAA'], rings=ALL[:100])
+            shards = space.shards(7)
+            self.assertEqual(sum(len(s) for s in shards), len(space))
+            self.assertEqual([k for s in shards for k in s], list(space))
+            part = space[10:20]
+            self.assertEqual(list(part), list(space)[10:20])
+            self.assertEqual(list(part[2:4]), list(space)[12:14])
+            self.assertRaises(KeySpaceError, space.__getitem__, slice(0, 10, 2))
+
+        def test_checkpoint(self):
+            space = KeySpace(('I', 'IV', 'V'), positions=['GTO'], cables=['AL', 'CT'])[100:5000]
+            with tempfile.TemporaryDirectory() as d:
+                cp = Checkpoint(os.path.join(d, 'search.json'))
+                self.assertIsNone(cp.load())
+                cp.save(space, 1234)
+                rest = cp.load()
+                self.assertEqual(len(rest), 5000 - 1234)
+                self.assertEqual(list(rest), list(space)[1134:])
+                cp.remove()
+                self.assertIsNone(cp.load())
+
+        def test_state(self):
+            for space in (KeySpace(('I', 'IV', 'V')), KeySpace(('I', 'IV', 'V'), ('B', 'C'), prune=True),
+                          KeySpace(('I', 'IV', 'V'), positions=['GTO'], prune=True)):
+                shard = space.shards(1024)[700]
+                self.assertLess(len(json.dumps(shard.state())), 200)
+                self.assertLess(len(pickle.dumps(shard)), 400)
+                for copy in (from_state(json.loads(json.dumps(shard.state()))), pickle.loads(pickle.dumps(shard))):
+                    self.assertEqual((copy.start, copy.stop), (shard.start, shard.stop))
+                    self.assertEqual(list(copy[:50]), list(shard[:50]))
+
+    unittest.main()
@@ -0,0 +1,137 @@
+import ast
+import mmap
+import operator
+
+import compiled
+import stepping
+
+class KeystreamError(Exception): pass
+
+# .npy version 1.0: magic, header length, a Python literal describing the
+# array, padded with spaces and a newline so the data is 64-byte aligned
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+
+class Permutations(object):
+    # Row i is the full machine permutation (plugboard included) used for
+    # the i-th keystroke, stored as a flat uint8 buffer of len * 26 bytes.
+    def __init__(self, data):
+        if len(data) % 26:
+            raise KeystreamError('permutation data is not a multiple of 26 bytes')
+        self.data = data
+
+    def __len__(self):
+        return len(self.data) // 26
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('keystroke out of range')
+        return self.data[index * 26:index * 26 + 26]
+
+    def column(self, x):
+        # outputs for the same input letter at every keystroke
+        return bytes(self.data[x::26])
+
+    def keystream(self, letter='A'):
+        return self.column(ord(letter) - compiled.A).translate(compiled.LETTERS).decode()
+
+    def translate(self, text, start=0):
+        if start + len(text) > len(self):
+            raise KeystreamError('text runs past the end of the export')
+        data = self.data
+        return ''.join(compiled.ALPHA[data[(start + i) * 26 + ord(c) - compiled.A]]
+                       for i, c in enumerate(text))
+
+    def save(self, path):
+        header = "{'descr': '|u1', 'fortran_order': False, 'shape': (%d, 26), }" % len(self)
+        pad = -(len(NPY_MAGIC) + 2 + len(header) + 1) % 64
+        header = (header + ' ' * pad + '\n').encode('latin1')
+        with open(path, 'wb') as f:
+            f.write(NPY_MAGIC + len(header).to_bytes(2, 'little') + header)
+            f.write(self.data)
+
+def export(rotors, rf, length, pos=None, ring=None, cables=None, start=0):
+    # permutations for keystrokes start + 1 .. start + length
+    data, pos, ring = compiled.key_data(rotors, rf, pos, ring)
+    states = stepping.Stepping(*rotors[-3:], pos).positions(length, start)
+    rows = [data[o * 26:o * 26 + 26] for o in compiled.ring_offsets(states, ring)]
+    plug = compiled.plugboard_perm(cables)
+    if plug != compiled.IDENTITY:
+        swap = operator.itemgetter(*plug)
+        rows = [bytes(swap(row)) for row in rows]
+        return Permutations(b''.join(rows).translate(plug + compiled.PAD))
+    return Permutations(b''.join(rows))
+
+def load(path):
+    with open(path, 'rb') as f:
+        if f.read(len(NPY_MAGIC)) != NPY_MAGIC:
+            raise KeystreamError(f'{path} is not a version 1.0 .npy file')
+        size = int.from_bytes(f.read(2), 'little')
+        header = ast.literal_eval(f.read(size).decode('latin1'))
+        offset = f.tell()
+        if header.get('descr') != '|u1' or header.get('fortran_order') or \
+                len(header.get('shape', ())) != 2 or header['shape'][1] != 26:
+            raise KeystreamError(f'{path} does not hold an N x 26 uint8 array')
+        if header['shape'][0] == 0:
+            return Permutations(b'')
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(data) - offset != header['shape'][0] * 26:
+        raise KeystreamError(f'{path} has the wrong size')
+    return Permutations(memoryview(data)[offset:])
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    import unittest
+
+    import enigma
+
+    class TestKeystream(unittest.TestCase):
+
+        def test_keystream(self):
+            p = export(('I', 'II', 'III'), 'B', 20)
+            self.assertEqual(p.keystream(), 'BDZGOWCXLTKSBTMCDLPB')
+            args = ('I', 'IV', 'V'), 'B', 'FJN', 'AOA', ['AL', 'CT', 'FN', 'OY']
+            p = export(args[0], args[1], 1000, *args[2:])
+            e = enigma.Enigma(*args[0], *args[1:])
+            self.assertEqual(p.keystream('Q'), e.translate('Q' * 1000))
+            text = 'THEQUICKBROWNFOXJUMPSOVERTHELAZYDOG' * 10
+            e.setPosition('FJN')
+            self.assertEqual(p.translate(text), e.translate(text))
+            self.assertRaises(KeystreamError, p.translate, text * 3)
+
+        def test_rows(self):
+            cables = ['AX', 'BU', 'FY', 'DH', 'IL', 'MW', 'VP']
+            p = export(('Gamma', 'VI', 'VII', 'IV'), 'CThin', 1600, 'QKTE', 'CLRM', cables)
+            e = enigma.Enigma4('Gamma', 'VI', 'VII', 'IV', 'CThin', 'QKTE', 'CLRM', cables)
+            self.assertEqual(p.keystream(), e.translate('A' * 1600))
+            for row in (p[0], p[777], p[-1]):
+                self.assertEqual(sorted(row), list(range(26)))
+                self.assertTrue(all(row[row[x]] == x and row[x] != x for x in range(26)))
+
+        def test_start(self):
+            full = export(('I', 'II', 'III'), 'B', 500, 'KDO')
+            part = export(('I', 'II', 'III'), 'B', 100, 'KDO', start=300)
+            self.assertEqual(part.data, full.data[300 * 26:400 * 26])
+
+        def test_npy(self):
+            p = export(('I', 'IV', 'V'), 'B', 333, 'GTO', 'AAB', ['AL', 'CT'])
+            with tempfile.TemporaryDirectory() as d:
+                path = os.path.join(d, 'perm.npy')
+                p.save(path)
+                with open(path, 'rb') as f:
+                    head = f.read(128)
+                self.assertEqual(head.index(b'\n') + 1, 128)
+                self.assertIn(b"'shape': (333, 26)", head)
+                q = load(path)
+                self.assertIsInstance(q.data.obj, mmap.mmap)
+                self.assertEqual(len(q), 333)
+                self.assertEqual(bytes(q.data), p.data)
+                self.assertEqual(q.keystream(), p.keystream())
+                del q
+                with open(path, 'r+b') as f:
+                    f.truncate(200)
+                self.assertRaises(KeystreamError, load, path)
+
+    unittest.main()
@@ -1,14 +1,13 @@
-import re
 import textwrap
 
 import enigma
+import stream
 
 def encode(e, i, key, msg, src):
     assert(len(key) == 6)
 
     # normalize message
-    norm_msg = msg.replace(' ', 'X').upper()
-    norm_msg = re.sub(r'[^A-Z]', '', norm_msg)
+    norm_msg = stream.normalize(msg)
 
     # first 3 letters of key sent in the clear
     out = key[0:3]
@@ -0,0 +1,158 @@
+import itertools
+
+def toggle(plug, a, b):
+    # remove the a-b cable if present, otherwise unplug a and b and join them
+    trial = bytearray(plug)
+    if trial[a] == b:
+        trial[a], trial[b] = a, b
+    else:
+        for x in (a, b):
+            trial[trial[x]] = trial[x]
+            trial[x] = x
+        trial[a], trial[b] = b, a
+    return trial
+
+class PlugboardOptimizer(object):
+    # Caches the scrambler row for every position of a fixed rotor state
+    # sequence.  Position i decrypts to plug[mid[i]] with
+    # mid[i] = rows[i][plug[cipher[i]]], so a plugboard change touching the
+    # letters L only affects positions whose cipher or mid letter is in L.
+    def __init__(self, data, offsets, cipher, ngrams, plug=None):
+        self.rows = [data[o * 26:o * 26 + 26] for o in offsets]
+        self.cipher = bytes(cipher)
+        self.ngrams = ngrams
+        self.plug = bytearray(range(26) if plug is None else plug)
+        self.by_cipher = [[] for _ in range(26)]
+        self.by_mid = [set() for _ in range(26)]
+        self.mid = bytearray(len(self.cipher))
+        self.out = bytearray(len(self.cipher))
+        for i, c in enumerate(self.cipher):
+            self.by_cipher[c].append(i)
+            m = self.mid[i] = self.rows[i][self.plug[c]]
+            self.by_mid[m].add(i)
+            self.out[i] = self.plug[m]
+        self.total = ngrams.score(self.out)
+
+    def affected(self, plug):
+        positions = set()
+        for x in range(26):
+            if plug[x] != self.plug[x]:
+                positions.update(self.by_cipher[x])
+                positions.update(self.by_mid[x])
+        return positions
+
+    def windows(self, positions):
+        # start of every n-gram that overlaps a changed position
+        n = self.ngrams.n
+        windows = set(positions)
+        for k in range(1, n):
+            windows.update([i - k for i in positions])
+        for j in range(-n + 1, 0):
+            windows.discard(j)
+        for j in range(len(self.out) - n + 1, len(self.out)):
+            windows.discard(j)
+        return windows
+
+    def partial(self, windows):
+        table = self.ngrams.table
+        out = self.out
+        n = self.ngrams.n
+        if n == 2:
+            return sum(table[out[j] * 26 + out[j + 1]] for j in windows)
+        if n == 3:
+            return sum(table[(out[j] * 26 + out[j + 1]) * 26 + out[j + 2]] for j in windows)
+        return sum(self.ngrams.score(out[j:j + n]) for j in windows)
+
+    def score(self, plug):
+        # decrypt the affected positions in place, score the n-grams that
+        # overlap them and put the old letters back
+        positions = self.affected(plug)
+        windows = self.windows(positions)
+        rows = self.rows
+        cipher = self.cipher
+        out = self.out
+        before = self.partial(windows)
+        for i in positions:
+            out[i] = plug[rows[i][plug[cipher[i]]]]
+        after = self.partial(windows)
+        current = self.plug
+        mid = self.mid
+        for i in positions:
+            out[i] = current[mid[i]]
+        return self.total + after - before
+
+    def setPlug(self, plug):
+        positions = self.affected(plug)
+        windows = self.windows(positions)
+        before = self.partial(windows)
+        for i in positions:
+            m = self.rows[i][plug[self.cipher[i]]]
+            self.by_mid[self.mid[i]].discard(i)
+            self.by_mid[m].add(i)
+            self.mid[i] = m
+            self.out[i] = plug[m]
+        self.total += self.partial(windows) - before
+        self.plug = bytearray(plug)
+
+    def climb(self):
+        improved = True
+        while improved:
+            improved = False
+            for a, b in itertools.combinations(range(26), 2):
+                trial = toggle(self.plug, a, b)
+                if self.score(trial) > self.total:
+                    self.setPlug(trial)
+                    improved = True
+        return self.total, bytes(self.plug)
+
+if __name__ == '__main__':
+    import random
+    import unittest
+
+    import cipheronly
+    import compiled
+    import stepping
+
+    class TestPlugboardOptimizer(unittest.TestCase):
+
+        def setUp(self):
+            random.seed(3)
+            self.data = compiled.get_scrambler(('I', 'II', 'III'), compiled.reflector_perm('B')).data
+            self.states = stepping.Stepping('I', 'II', 'III', 'KDO').positions(300)
+            self.offsets = compiled.ring_offsets(self.states, (0, 3, 7))
+            self.cipher = bytes(random.randrange(26) for _ in range(300))
+            self.ngrams = cipheronly.build_ngrams('THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG ' * 3, 3)
+
+        def full(self, plug):
+            out = cipheronly.decrypt(self.data, self.states, (0, 3, 7), plug, self.cipher)
+            return self.ngrams.score(out)
+
+        def test_toggle(self):
+            plug = toggle(range(26), 0, 1)
+            self.assertEqual(plug[:3], bytes([1, 0, 2]))
+            plug = toggle(plug, 1, 2)
+            self.assertEqual(plug[:3], bytes([0, 2, 1]))
+            plug = toggle(plug, 2, 1)
+            self.assertEqual(plug, bytes(range(26)))
+
+        def test_incremental(self):
+            opt = PlugboardOptimizer(self.data, self.offsets, self.cipher, self.ngrams)
+            self.assertAlmostEqual(opt.total, self.full(range(26)), places=2)
+            plug = bytearray(range(26))
+            for _ in range(50):
+                plug = toggle(plug, *random.sample(range(26), 2))
+                self.assertAlmostEqual(opt.score(plug), self.full(plug), places=2)
+                if random.random() < 0.5:
+                    opt.setPlug(plug)
+                    self.assertAlmostEqual(opt.total, self.full(plug), places=2)
+                else:
+                    plug = opt.plug
+
+        def test_climb(self):
+            opt = PlugboardOptimizer(self.data, self.offsets, self.cipher, self.ngrams)
+            start = opt.total
+            score, plug = opt.climb()
+            self.assertGreaterEqual(score, start)
+            self.assertAlmostEqual(score, self.full(plug), places=2)
+
+    unittest.main()
@@ -1,34 +1,71 @@
+import collections
+import string
+
 import plugboard
 
 class ReflectorError(Exception): pass
 
+ALPHA = string.ascii_uppercase
+A = ord('A')
+
+ReflectorSpec = collections.namedtuple('ReflectorSpec', 'cables table perm')
+
+def make_spec(cables):
+    pb = plugboard.Plugboard(cables)
+    if len(pb.plugs) != 26:
+        raise ReflectorError('a reflector needs 13 cables covering every letter')
+    perm = tuple(ord(pb.translate(c)) - A for c in ALPHA)
+    return ReflectorSpec(tuple(pb.cables), pb.table, perm)
+
+SPECS = {}
+
+def register(name, cables):
+    spec = SPECS[name] = make_spec(cables)
+    return spec
+
 class Reflector(plugboard.Plugboard):
     def __init__(self, wiring):
-        super().__init__(wiring)
+        if not isinstance(wiring, ReflectorSpec):
+            wiring = make_spec(wiring)
+        # the spec is already validated, so share its table instead of
+        # plugging in every cable again
+        self.spec = wiring
+        self.cables = list(wiring.cables)
+        self.plugs = set(ALPHA)
+        self.table = wiring.table
+
+    def activate(self):
+        super().activate()
+        self.spec = None
+
+register('B',     ('AY', 'BR', 'CU', 'DH', 'EQ',
+                   'FS', 'GL', 'IP', 'JX', 'KN',
+                   'MO', 'TZ', 'VW'))
+register('C',     ('AF', 'BV', 'CP', 'DJ', 'EI',
+                   'GO', 'HY', 'KR', 'LZ', 'MX',
+                   'NW', 'QT', 'SU'))
+register('BThin', ('AE', 'BN', 'CK', 'DQ', 'FU',
+                   'GY', 'HW', 'IJ', 'LO', 'MP',
+                   'RX', 'SZ', 'TV'))
+register('CThin', ('AR', 'BD', 'CO', 'EJ', 'FN',
+                   'GT', 'HK', 'IV', 'LM', 'PW',
+                   'QZ', 'SX', 'UY'))
 
 class ReflectorB(Reflector):
     def __init__(self):
-        super().__init__(('AY', 'BR', 'CU', 'DH', 'EQ',
-                          'FS', 'GL', 'IP', 'JX', 'KN',
-                          'MO', 'TZ', 'VW'))
+        super().__init__(SPECS['B'])
 
 class ReflectorC(Reflector):
     def __init__(self):
-        super().__init__(('AF', 'BV', 'CP', 'DJ', 'EI',
-                          'GO', 'HY', 'KR', 'LZ', 'MX',
-                          'NW', 'QT', 'SU'))
+        super().__init__(SPECS['C'])
 
 class ReflectorBThin(Reflector):
     def __init__(self):
-        super().__init__(('AE', 'BN', 'CK', 'DQ', 'FU',
-                          'GY', 'HW', 'IJ', 'LO', 'MP',
-                          'RX', 'SZ', 'TV'))
+        super().__init__(SPECS['BThin'])
 
 class ReflectorCThin(Reflector):
     def __init__(self):
-        super().__init__(('AR', 'BD', 'CO', 'EJ', 'FN',
-                          'GT', 'HK', 'IV', 'LM', 'PW',
-                          'QZ', 'SX', 'UY'))
+        super().__init__(SPECS['CThin'])
 
 if __name__ == '__main__':
     import unittest
@@ -55,4 +92,15 @@ if __name__ == '__main__':
             for i, c in enumerate('RDOBJNTKVEHMLFCWZAXGYIPSUQ', ord('A')):
                 self.assertEqual(c, r.translate(chr(i)))
 
+        def test_custom(self):
+            # UKW-D style rewirable reflector
+            r = Reflector(('AI', 'BM', 'CE', 'DT', 'FG', 'HR', 'JY', 'KS', 'LQ', 'NZ', 'OP', 'UX', 'VW'))
+            self.assertEqual('I', r.translate('A'))
+            self.assertEqual('Y', r.translate('J'))
+            self.assertRaises(ReflectorError, Reflector, ('AB', 'CD'))
+            self.assertRaises(plugboard.PlugboardDuplicatePlug, Reflector, ('AB', 'AC'))
+
+        def test_shared(self):
+            self.assertIs(ReflectorB().table, ReflectorB().table)
+
     unittest.main()
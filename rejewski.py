@@ -0,0 +1,217 @@
+import array
+import collections
+import itertools
+import json
+import multiprocessing
+import re
+import string
+
+import compiled
+import stepping
+
+class IndicatorError(Exception): pass
+
+ALPHA = string.ascii_uppercase
+A = ord('A')
+MAGIC = b'RJWK'
+
+Setting = collections.namedtuple('Setting', 'rotors rf pos')
+
+def partitions(n, largest=None):
+    largest = n if largest is None else largest
+    if n == 0:
+        yield ()
+    for k in range(min(n, largest), 0, -1):
+        for rest in partitions(n - k, k):
+            yield (k,) + rest
+
+# AD, BE and CF are products of two fixed point free involutions, so their
+# cycles come in pairs of equal length and the cycle structure is one of
+# the 101 partitions of 13
+PARTITIONS = list(partitions(13))
+PARTITION_INDEX = {p: i for i, p in enumerate(PARTITIONS)}
+
+def cycle_type(perm):
+    seen = bytearray(26)
+    lengths = []
+    for x in range(26):
+        n = 0
+        while not seen[x]:
+            seen[x] = 1
+            x = perm[x]
+            n += 1
+        if n:
+            lengths.append(n)
+    lengths.sort(reverse=True)
+    half = tuple(lengths[::2])
+    if half != tuple(lengths[1::2]):
+        raise IndicatorError('cycles are not paired, not an Enigma characteristic')
+    return PARTITION_INDEX[half]
+
+def characteristic(perms):
+    # perms are the six permutations used for the doubled message key
+    return tuple(cycle_type(perms[i].translate(perms[i + 3] + compiled.PAD)) for i in range(3))
+
+def code_of(char):
+    a, b, c = char
+    return (a * 101 + b) * 101 + c
+
+def indicator_permutations(indicators):
+    # indicator letters i and i + 3 encrypt the same key letter, so together
+    # they give one pair of the product AD, BE or CF
+    perms = [bytearray(b'\xff' * 26) for _ in range(3)]
+    for ind in indicators:
+        if len(ind) != 6:
+            raise IndicatorError(f'{ind} is not a doubled three letter key')
+        for i, perm in enumerate(perms):
+            x, y = ord(ind[i]) - A, ord(ind[i + 3]) - A
+            if perm[x] not in (0xff, y):
+                raise IndicatorError(f'{ind} contradicts an earlier indicator')
+            perm[x] = y
+    for name, perm in zip(('AD', 'BE', 'CF'), perms):
+        if 0xff in perm:
+            raise IndicatorError(f'not enough indicators to complete {name}')
+    return [bytes(p) for p in perms]
+
+def indicator_characteristic(indicators):
+    return tuple(cycle_type(p) for p in indicator_permutations(indicators))
+
+def indicators_of(ciphers, setting=None):
+    # message.encode sends the indicator setting in the clear followed by
+    # the doubled key; only messages sharing one setting can be combined
+    out = []
+    for c in ciphers:
+        letters = ''.join(re.findall(r'[A-Z]+', c))
+        if setting is None or letters[:3] == setting:
+            out.append(letters[3:9])
+    return out
+
+def _catalogue_shard(args):
+    # positions are rotor offsets (position - ring) and only the right rotor
+    # steps, like the original catalogue: where the rings put the notches is
+    # unknown, so a day with a turnover within the indicator is missed
+    order, rf = args
+    data = compiled.get_scrambler(order, compiled.reflector_perm(rf)).data
+    codes = array.array('I')
+    for start in range(17576):
+        perms = []
+        state = start
+        for _ in range(6):
+            state = state - state % 26 + (state + 1) % 26
+            perms.append(data[state * 26:state * 26 + 26])
+        codes.append(code_of(characteristic(perms)))
+    return codes
+
+class Catalogue(object):
+    # One characteristic code per rotor order, reflector and position with
+    # the rings at 'AAA', ranked like keyspace.KeySpace.  A found position is
+    # the ground setting minus the rings.
+    def __init__(self, rotors, reflectors, codes):
+        self.rotors = tuple(rotors)
+        self.reflectors = tuple(reflectors)
+        self.orders = list(itertools.permutations(self.rotors, 3))
+        if len(codes) != len(self.orders) * len(self.reflectors) * 17576:
+            raise IndicatorError('catalogue size does not match its rotors and reflectors')
+        self.codes = codes
+        self.index = collections.defaultdict(list)
+        for rank, code in enumerate(codes):
+            self.index[code].append(rank)
+
+    def setting(self, rank):
+        rank, pos = divmod(rank, 17576)
+        order, rf = divmod(rank, len(self.reflectors))
+        return Setting(self.orders[order], self.reflectors[rf], stepping.position_string(pos))
+
+    def lookup(self, char):
+        return [self.setting(rank) for rank in self.index.get(code_of(char), ())]
+
+    def save(self, path):
+        header = json.dumps({'rotors': self.rotors, 'reflectors': self.reflectors}).encode()
+        with open(path, 'wb') as f:
+            f.write(MAGIC + len(header).to_bytes(2, 'little') + header)
+            self.codes.tofile(f)
+
+def build_catalogue(rotors, reflectors=('B',), processes=None):
+    jobs = [(order, rf) for order in itertools.permutations(rotors, 3) for rf in reflectors]
+    if processes == 1:
+        shards = map(_catalogue_shard, jobs)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            shards = pool.map(_catalogue_shard, jobs)
+    codes = array.array('I')
+    for shard in shards:
+        codes.extend(shard)
+    return Catalogue(rotors, reflectors, codes)
+
+def load_catalogue(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise IndicatorError(f'{path} is not a characteristic catalogue')
+        header = json.loads(f.read(int.from_bytes(f.read(2), 'little')))
+        codes = array.array('I')
+        codes.frombytes(f.read())
+    return Catalogue(header['rotors'], header['reflectors'], codes)
+
+def solve(indicators, catalogue):
+    return catalogue.lookup(indicator_characteristic(indicators))
+
+if __name__ == '__main__':
+    import os
+    import random
+    import tempfile
+    import unittest
+
+    import enigma
+    import message
+
+    class TestRejewski(unittest.TestCase):
+
+        def indicators(self, e, ground, count):
+            random.seed(5)
+            out = []
+            for _ in range(count):
+                key = ''.join(random.choice(ALPHA) for _ in range(3))
+                e.setPosition(ground)
+                out.append(e.translate(key * 2))
+            return out
+
+        def test_partitions(self):
+            self.assertEqual(len(PARTITIONS), 101)
+            self.assertEqual(PARTITIONS[0], (13,))
+            self.assertEqual(PARTITIONS[-1], (1,) * 13)
+
+        def test_plugboard_invariant(self):
+            e = enigma.Enigma('I', 'IV', 'V', 'B', cables=['AL', 'CT', 'FN', 'OY', 'QZ'])
+            f = enigma.Enigma('I', 'IV', 'V', 'B')
+            self.assertEqual(indicator_characteristic(self.indicators(e, 'GTO', 300)),
+                             indicator_characteristic(self.indicators(f, 'GTO', 300)))
+
+        def test_indicators(self):
+            self.assertRaises(IndicatorError, indicator_permutations, ['ABCDEF'])
+            self.assertRaises(IndicatorError, indicator_permutations, ['ABCDEF', 'AXXEXX'])
+            self.assertRaises(IndicatorError, indicator_permutations, ['ABCD'])
+            e = enigma.Enigma('I', 'IV', 'V', 'B', ring='AOA', cables=['AL', 'CT', 'FN', 'OY'])
+            ciphers = [message.encode(e, 1, k, 'Knowledge is power.', '')[1]
+                       for k in ('AAAAAA', 'AAAMOR', 'DWSXYZ')]
+            self.assertEqual(len(indicators_of(ciphers)), 3)
+            self.assertEqual(indicators_of(ciphers, 'AAA'), indicators_of(ciphers[:2]))
+            e.setPosition('AAA')
+            self.assertEqual(indicators_of(ciphers[1:2]), [e.translate('MORMOR')])
+
+        def test_solve(self):
+            e = enigma.Enigma('V', 'I', 'IV', 'B', cables=['AL', 'CT', 'FN', 'OY', 'QZ', 'BX'])
+            inds = self.indicators(e, 'KDS', 300)
+            catalogue = build_catalogue(('I', 'IV', 'V'), processes=1)
+            self.assertIn(Setting(('V', 'I', 'IV'), 'B', 'KDS'), solve(inds, catalogue))
+            # the rings shift the offsets and move the notch: from offset G
+            # the right rotor passes J, where IV would turn over at ring A
+            e = enigma.Enigma('V', 'I', 'IV', 'B', ring='AWM', cables=['AL', 'CT', 'FN', 'OY'])
+            self.assertIn(Setting(('V', 'I', 'IV'), 'B', 'KHG'), solve(self.indicators(e, 'KDS', 300), catalogue))
+            with tempfile.TemporaryDirectory() as d:
+                path = os.path.join(d, 'catalogue.bin')
+                catalogue.save(path)
+                loaded = load_catalogue(path)
+                self.assertEqual(loaded.codes, catalogue.codes)
+                self.assertEqual(solve(inds, loaded), solve(inds, catalogue))
+
+    unittest.main()
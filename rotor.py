@@ -1,3 +1,5 @@
+import collections
+import functools
 import string
 
 class RotorError(Exception): pass
@@ -9,10 +11,44 @@ class RotorError(Exception): pass
 ALPHA = string.ascii_uppercase
 A = ord('A')
 
+RotorSpec = collections.namedtuple('RotorSpec', 'letters wiring notches')
+
+def make_spec(wiring, notches):
+    if sorted(wiring) != list(ALPHA):
+        raise RotorError(f'wiring {wiring!r} is not a permutation of {ALPHA}')
+    if any(n not in ALPHA for n in notches):
+        raise RotorError(f'bad notch in {notches!r}')
+    return RotorSpec(wiring,
+                     tuple(ord(w) - i for i, w in enumerate(wiring, A)),
+                     frozenset(ord(n) - A for n in notches))
+
+SPECS = {}
+
+@functools.lru_cache(maxsize=1024)
+def tables(wiring, position):
+    # translate tables for one wiring at one offset (position - ring), shared
+    # by every rotor so stepping never rebuilds them
+    rpath = {}
+    lpath = {}
+    for i in range(26):
+        rpos = (i - position) % 26
+        lpos = (rpos + wiring[i]) % 26
+        rpath[chr(A + rpos)] = chr(A + lpos)
+        lpath[chr(A + lpos)] = chr(A + rpos)
+    return ''.maketrans(rpath), ''.maketrans(lpath)
+
+def register(name, wiring, notches):
+    spec = SPECS[name] = make_spec(wiring, notches)
+    return spec
+
 class Rotor(object):
-    def __init__(self, wiring, notches, position=None, ring=None, doublestep=False):
-        self.setWiring(wiring)
-        self.setNotches(notches)
+    def __init__(self, wiring, notches=None, position=None, ring=None, doublestep=False):
+        if isinstance(wiring, RotorSpec):
+            self.spec = wiring
+        else:
+            self.spec = make_spec(wiring, notches)
+        self.wiring = self.spec.wiring
+        self.notches = self.spec.notches
         self.position = 0
         self.prev_pos = None
         self.ring = 0
@@ -23,7 +59,8 @@ class Rotor(object):
             self.setRing(ring)
 
     def setWiring(self, wiring):
-        self.wiring = [ord(w) - i for i, w in enumerate(wiring, ord('A'))]
+        self.wiring = tuple(ord(w) - i for i, w in enumerate(wiring, ord('A')))
+        self.prev_pos = None
 
     def setNotches(self, notches):
         self.notches = [ord(n) - A for n in notches]
@@ -36,6 +73,7 @@ class Rotor(object):
 
     def setRing(self, ring):
         self.ring = ord(ring) - A
+        self.prev_pos = None
 
     def step(self, do_step=True):
         turnover = False
@@ -48,16 +86,7 @@ class Rotor(object):
         if self.position == self.prev_pos:
             return
         self.prev_pos = self.position
-        rpath = {}
-        lpath = {}
-        position = (self.position - self.ring) % 26
-        for i in range(26):
-            rpos = (i - position) % 26
-            lpos = (rpos + self.wiring[i]) % 26
-            rpath[chr(A + rpos)] = chr(A + lpos)
-            lpath[chr(A + lpos)] = chr(A + rpos)
-        self.rtable = ''.maketrans(rpath)
-        self.ltable = ''.maketrans(lpath)
+        self.rtable, self.ltable = tables(self.wiring, (self.position - self.ring) % 26)
 
     def rtrans(self, char):
         self.activate()
@@ -67,45 +96,56 @@ class Rotor(object):
         self.activate()
         return char.translate(self.ltable)
 
+register('I',     'EKMFLGDQVZNTOWYHXUSPAIBRCJ', 'Q')
+register('II',    'AJDKSIRUXBLHWTMCQGZNPYFVOE', 'E')
+register('III',   'BDFHJLCPRTXVZNYEIWGAKMUSQO', 'V')
+register('IV',    'ESOVPZJAYQUIRHXLNFTGKDCMWB', 'J')
+register('V',     'VZBRGITYUPSDNHLXAWMJQOFECK', 'Z')
+register('VI',    'JPGVOUMFYQBENHZRDKASXLICTW', 'ZM')
+register('VII',   'NZJHGRCXMYSWBOUFAIVLPEKQDT', 'ZM')
+register('VIII',  'FKQHTLXOCBJSPDZRAMEWNIUYGV', 'ZM')
+register('Beta',  'LEYJVCNIXWPBQMDRTAKZGFUHOS', '')
+register('Gamma', 'FSOKANUERHMBTIYCWLQPZXVGJD', '')
+
 class RotorI(Rotor):
     def __init__(self, position=None, ring=None, doublestep=False):
-        super().__init__('EKMFLGDQVZNTOWYHXUSPAIBRCJ', 'Q', position, ring, doublestep)
+        super().__init__(SPECS['I'], None, position, ring, doublestep)
 
 class RotorII(Rotor):
     def __init__(self, position=None, ring=None, doublestep=False):
-        super().__init__('AJDKSIRUXBLHWTMCQGZNPYFVOE', 'E', position, ring, doublestep)
+        super().__init__(SPECS['II'], None, position, ring, doublestep)
 
 class RotorIII(Rotor):
     def __init__(self, position=None, ring=None, doublestep=False):
-        super().__init__('BDFHJLCPRTXVZNYEIWGAKMUSQO', 'V', position, ring, doublestep)
+        super().__init__(SPECS['III'], None, position, ring, doublestep)
 
 class RotorIV(Rotor):
     def __init__(self, position=None, ring=None, doublestep=False):
-        super().__init__('ESOVPZJAYQUIRHXLNFTGKDCMWB', 'J', position, ring, doublestep)
+        super().__init__(SPECS['IV'], None, position, ring, doublestep)
 
 class RotorV(Rotor):
     def __init__(self, position=None, ring=None, doublestep=False):
-        super().__init__('VZBRGITYUPSDNHLXAWMJQOFECK', 'Z', position, ring, doublestep)
+        super().__init__(SPECS['V'], None, position, ring, doublestep)
 
 class RotorVI(Rotor):
     def __init__(self, position=None, ring=None, doublestep=False):
-        super().__init__('JPGVOUMFYQBENHZRDKASXLICTW', 'ZM', position, ring, doublestep)
+        super().__init__(SPECS['VI'], None, position, ring, doublestep)
 
 class RotorVII(Rotor):
     def __init__(self, position=None, ring=None, doublestep=False):
-        super().__init__('NZJHGRCXMYSWBOUFAIVLPEKQDT', 'ZM', position, ring, doublestep)
+        super().__init__(SPECS['VII'], None, position, ring, doublestep)
 
 class RotorVIII(Rotor):
     def __init__(self, position=None, ring=None, doublestep=False):
-        super().__init__('FKQHTLXOCBJSPDZRAMEWNIUYGV', 'ZM', position, ring, doublestep)
+        super().__init__(SPECS['VIII'], None, position, ring, doublestep)
 
 class RotorBeta(Rotor):
     def __init__(self, position=None, ring=None):
-        super().__init__('LEYJVCNIXWPBQMDRTAKZGFUHOS', '', position, ring, False)
+        super().__init__(SPECS['Beta'], None, position, ring, False)
 
 class RotorGamma(Rotor):
     def __init__(self, position=None, ring=None):
-        super().__init__('FSOKANUERHMBTIYCWLQPZXVGJD', '', position, ring, False)
+        super().__init__(SPECS['Gamma'], None, position, ring, False)
 
 if __name__ == '__main__':
     import unittest
@@ -287,6 +327,17 @@ if __name__ == '__main__':
             self.assertEqual(r2.getPosition(), 'F')
             self.assertEqual(r3.getPosition(), 'B')
 
+        def test_shared_tables(self):
+            r = RotorIII(position='M')
+            r.activate()
+            hits = tables.cache_info().hits
+            s = RotorIII(position='N', ring='B')
+            s.activate()
+            self.assertIs(s.rtable, r.rtable)
+            self.assertEqual(tables.cache_info().hits, hits + 1)
+            s.setRing('A')
+            self.assertEqual(s.rtrans('A'), RotorIII(position='N').rtrans('A'))
+
         def test_ThreeRotorPartialDoublestep(self):
             r3 = RotorI(position='D', ring='A')
             r2 = RotorIV(position='J', ring='O', doublestep=True)
@@ -0,0 +1,305 @@
+import array
+import collections
+import itertools
+import multiprocessing
+import string
+
+import batch
+import compiled
+import stats
+import stepping
+
+ALPHA = string.ascii_uppercase
+A = ord('A')
+
+Drag = collections.namedtuple('Drag', 'offset key')
+
+def shards(rotors, reflectors, pos=None, greeks=()):
+    # A shard covers the left rotor settings (ring, or offset when searching
+    # offsets) in its third field.  With greeks the shards are for the M4: a
+    # greek wheel in front of each rotor order and one shard per greek offset
+    # (position - ring) covering every left setting, so each shard builds
+    # one folded scrambler table.
+    for order in itertools.permutations(rotors, 3):
+        for rf in reflectors:
+            if not greeks:
+                for ring1 in ALPHA:
+                    yield order, rf, ring1, pos, None
+            for greek in greeks:
+                for g in range(26):
+                    yield (greek,) + order, rf, ALPHA, pos, g
+
+def _greek_keys(hits, order, greek, pos):
+    # report the greek wheel at its given position (or 'A') with the ring
+    # that gives the searched offset
+    if greek is None:
+        return hits
+    gp = 'A' if pos is None else pos[0]
+    gr = ALPHA[(ord(gp) - A - greek) % 26]
+    return [key._replace(rotors=order, pos=gp + key.pos, ring=gr + key.ring) for key in hits]
+
+def _search_shard(args):
+    (order, rf, rings1, pos, greek), cables, plain, cipher = args
+    hits = []
+    rotors = order[-3:]
+    data = compiled.scrambler_data(order, rf, greek)
+    matcher = compiled.CribMatcher(plain, cipher, cables)
+    positions = [pos[-3:]] if pos is not None else [''.join(p) for p in itertools.product(ALPHA, repeat=3)]
+    for p in positions:
+        states = stepping.Stepping(*rotors, p).positions(len(plain))
+        for ring1 in rings1:
+            r1 = ord(ring1) - A
+            for r2 in range(26):
+                for r3 in range(26):
+                    if matcher.matchRing(data, states, (r1, r2, r3)):
+                        ring = ring1 + ALPHA[r2] + ALPHA[r3]
+                        hits.append(batch.Key(rotors, rf, p, ring, cables))
+    stats.count('keys', len(positions) * len(rings1) * 676)
+    return _greek_keys(hits, order, greek, pos)
+
+def _search_space_shard(args):
+    space, plain, cipher = args
+    hits = []
+    matcher = compiled.CribMatcher(plain, cipher, space.cables)
+    setting = None
+    for key in space:
+        if setting != (key.rotors, key.rf, key.pos):
+            setting = (key.rotors, key.rf, key.pos)
+            data = compiled.get_scrambler(key.rotors, compiled.reflector_perm(key.rf)).data
+            states = stepping.Stepping(*key.rotors, key.pos).positions(len(plain))
+        if matcher.matchRing(data, states, [ord(r) - A for r in key.ring]):
+            hits.append(key)
+    stats.count('keys', len(space))
+    return hits
+
+def search_space(space, plain, cipher, shards=None, processes=None, checkpoint=None):
+    # Searches a keyspace.KeySpace in contiguous shards.  With a checkpoint
+    # the end of every finished run of shards is saved, so a restarted
+    # search can pass checkpoint.load() as its space and carry on.
+    jobs = [(shard, plain, cipher) for shard in space.shards(shards or 1024)]
+    with multiprocessing.Pool(processes) as pool:
+        for (shard, _, _), (hits, snap) in zip(jobs, pool.imap(stats.Collect(_search_space_shard), jobs)):
+            if snap is not None:
+                stats.merge(snap)
+            yield from hits
+            if checkpoint is not None:
+                checkpoint.save(space, shard.stop)
+
+def stepping_patterns(order, length, pos=None):
+    # Offsets (position - ring) drive the cipher, positions drive the
+    # stepping.  Group the middle/right start positions by the offset deltas
+    # they produce over the crib; the left start position never affects
+    # stepping so it is folded into the left offset.
+    key = (order, length, pos)
+    if key not in _patterns:
+        if pos is None:
+            starts = itertools.product(range(26), repeat=2)
+        else:
+            starts = [(ord(pos[1]) - A, ord(pos[2]) - A)]
+        patterns = {}
+        for m0, r0 in starts:
+            states = stepping.Stepping(*order, 'A' + ALPHA[m0] + ALPHA[r0]).positions(length)
+            deltas = array.array('H', ((s // 676 * 26 + (s // 26 - m0) % 26) * 26 + (s - r0) % 26
+                                       for s in states))
+            patterns.setdefault(deltas.tobytes(), (deltas, []))[1].append((m0, r0))
+        _patterns[key] = list(patterns.values())
+    return _patterns[key]
+
+_patterns = {}
+
+def _offsets_hits(data, matcher, patterns, o1, p1, rotors, rf, cables):
+    hits = []
+    for deltas, starts in patterns:
+        for o2 in range(26):
+            for o3 in range(26):
+                if not matcher.matchRing(data, deltas, (-o1 % 26, -o2 % 26, -o3 % 26)):
+                    continue
+                # recover positions and rings from where the turnovers fall
+                for m0, r0 in starts:
+                    p = ALPHA[p1] + ALPHA[m0] + ALPHA[r0]
+                    ring = ALPHA[(p1 - o1) % 26] + ALPHA[(m0 - o2) % 26] + ALPHA[(r0 - o3) % 26]
+                    hits.append(batch.Key(rotors, rf, p, ring, cables))
+    return hits
+
+def _search_offsets_shard(args):
+    (order, rf, lefts, pos, greek), cables, plain, cipher = args
+    hits = []
+    rotors = order[-3:]
+    pos3 = None if pos is None else pos[-3:]
+    data = compiled.scrambler_data(order, rf, greek)
+    matcher = compiled.CribMatcher(plain, cipher, cables)
+    p1 = 0 if pos is None else ord(pos3[0]) - A
+    patterns = stepping_patterns(rotors, len(plain), pos3)
+    for left in lefts:
+        hits.extend(_offsets_hits(data, matcher, patterns, ord(left) - A, p1, rotors, rf, cables))
+    stats.count('keys', sum(len(starts) for _, starts in patterns) * len(lefts) * 676)
+    return _greek_keys(hits, order, greek, pos)
+
+def _run(worker, jobs, processes, first):
+    # leaving the with block terminates the workers, so closing the
+    # generator (or stopping at the first hit) cancels the rest of the search
+    with multiprocessing.Pool(processes) as pool:
+        for hits, snap in pool.imap_unordered(stats.Collect(worker), jobs):
+            if snap is not None:
+                stats.merge(snap)
+            for key in hits:
+                yield key
+                if first:
+                    return
+
+def search(plain, cipher, rotors, reflectors=('B',), pos=None, cables=None, processes=None, first=False,
+           greeks=()):
+    # With greeks (e.g. ('Beta', 'Gamma') and reflectors ('BThin', 'CThin'))
+    # the M4 is searched; pos then has four letters.
+    jobs = ((shard, cables, plain, cipher) for shard in shards(rotors, reflectors, pos, greeks))
+    return _run(_search_shard, jobs, processes, first)
+
+def search_offsets(plain, cipher, rotors, reflectors=('B',), pos=None, cables=None, processes=None, first=False,
+                   greeks=()):
+    # Same results as search(), but searches the rotor offsets with the ring
+    # fixed at 'AAA' and derives the ring settings afterwards.  With pos None
+    # only the left offset is searched instead of the left position and
+    # ring, and each key is reported with its left rotor at 'A'.
+    jobs = ((shard, cables, plain, cipher) for shard in shards(rotors, reflectors, pos, greeks))
+    return _run(_search_offsets_shard, jobs, processes, first)
+
+def alignments(crib, cipher):
+    # Enigma never encrypts a letter to itself, so the crib cannot sit where
+    # any of its letters lines up with the same cipher letter.  Each cipher
+    # letter rules out one offset per matching crib letter.
+    n = len(cipher) - len(crib) + 1
+    if n <= 0:
+        return []
+    where = collections.defaultdict(list)
+    for i, c in enumerate(crib):
+        where[c].append(i)
+    ok = bytearray(b'\x01') * n
+    for j, c in enumerate(cipher):
+        for i in where.get(c, ()):
+            if 0 <= j - i < n:
+                ok[j - i] = 0
+    return [k for k in range(n) if ok[k]]
+
+def _drag_shard(args):
+    offset, (order, rf, left, pos, greek), cables, plain, cipher = args
+    # with the message start known the rotors at the crib are known too, and
+    # the hits are reported as keys for the whole message
+    at = None
+    if pos is not None:
+        state = stepping.Stepping(*order[-3:], pos[-3:]).state(offset)
+        at = pos[:-3] + stepping.position_string(state)
+    hits = _search_offsets_shard(((order, rf, left, at, greek), cables, plain, cipher))
+    if pos is not None:
+        hits = [key._replace(pos=pos) for key in hits]
+    return [Drag(offset, key) for key in hits]
+
+def drag(crib, cipher, rotors, reflectors=('B',), pos=None, cables=None, processes=None, first=False,
+         greeks=()):
+    # Searches every alignment of the crib that survives alignments().  With
+    # pos None the keys give the rotor positions at the start of the crib.
+    jobs = ((offset, shard, cables, crib, cipher[offset:offset + len(crib)])
+            for offset in alignments(crib, cipher)
+            for shard in shards(rotors, reflectors, pos, greeks))
+    return _run(_drag_shard, jobs, processes, first)
+
+if __name__ == '__main__':
+    import unittest
+
+    class TestSearch(unittest.TestCase):
+
+        def test_search(self):
+            cables = ['AL', 'CT', 'FN', 'IY']
+            p = 'A' * 10
+            c = compiled.CompiledEnigma('IV', 'I', 'V', 'B', 'GTO', 'QEB', cables).translate(p)
+            keys = list(search(p, c, ('I', 'IV', 'V'), pos='GTO', cables=cables, processes=4))
+            self.assertIn(batch.Key(('IV', 'I', 'V'), 'B', 'GTO', 'QEB', cables), keys)
+
+        def test_first(self):
+            p = 'A' * 10
+            c = compiled.CompiledEnigma('I', 'II', 'III', 'C', 'AAA', 'BCD').translate(p)
+            keys = list(search(p, c, ('I', 'II', 'III'), ('B', 'C'), pos='AAA', processes=2, first=True))
+            self.assertEqual(len(keys), 1)
+            self.assertEqual(compiled.CompiledEnigma(*keys[0].rotors, keys[0].rf, 'AAA', keys[0].ring).translate(p), c)
+
+        def test_search_offsets(self):
+            cables = ['AL', 'CT', 'FN', 'IY']
+            p = 'A' * 10
+            c = compiled.CompiledEnigma('IV', 'I', 'V', 'B', 'GTO', 'QEB', cables).translate(p)
+            rotors = ('I', 'IV', 'V')
+            self.assertEqual(sorted(search_offsets(p, c, rotors, pos='GTO', cables=cables, processes=2)),
+                             sorted(search(p, c, rotors, pos='GTO', cables=cables, processes=2)))
+
+        def test_search_offsets_nopos(self):
+            p = 'A' * 12
+            c = compiled.CompiledEnigma('I', 'IV', 'V', 'B', 'FJN', 'AOA').translate(p)
+            keys = list(search_offsets(p, c, ('I', 'IV', 'V'), processes=2))
+            self.assertIn(batch.Key(('I', 'IV', 'V'), 'B', 'AJN', 'VOA'), keys)
+            for key in keys:
+                self.assertEqual(compiled.CompiledEnigma(*key.rotors, key.rf, key.pos, key.ring).translate(p), c)
+
+        def test_stats(self):
+            p = 'A' * 10
+            c = compiled.CompiledEnigma('IV', 'I', 'V', 'B', 'GTO', 'QEB').translate(p)
+            stats.enable()
+            try:
+                list(search_offsets(p, c, ('I', 'IV', 'V'), pos='GTO', processes=2))
+                snap = stats.snapshot()
+            finally:
+                stats.enable(False)
+                stats.reset()
+            self.assertEqual(snap['counters']['keys'], 6 * 26 ** 3)
+            self.assertEqual(snap['timings']['shard']['count'], 6 * 26)
+
+        def test_search4(self):
+            cables = ['AL', 'CT', 'FN', 'IY']
+            p = 'A' * 12
+            key = batch.Key(('Gamma', 'IV', 'I', 'V'), 'CThin', 'CGTO', 'HQEB', cables)
+            c = batch.make_machine(key).translate(p)
+            keys = list(search_offsets(p, c, ('I', 'IV', 'V'), ('CThin',), 'CGTO', cables,
+                                       processes=2, greeks=('Gamma',)))
+            self.assertIn(key, keys)
+            for k in keys:
+                self.assertEqual(batch.make_machine(k).translate(p), c)
+
+        def test_alignments(self):
+            crib = 'WETTERBERICHT'
+            cipher = compiled.CompiledEnigma('I', 'IV', 'V', 'B', 'FJN').translate('XYZ' * 40)
+            want = [k for k in range(len(cipher) - len(crib) + 1)
+                    if all(p != c for p, c in zip(crib, cipher[k:]))]
+            self.assertEqual(alignments(crib, cipher), want)
+            self.assertLess(len(want), len(cipher) - len(crib) + 1)
+            self.assertEqual(alignments(crib, 'ABC'), [])
+
+        def test_drag(self):
+            cables = ['AL', 'CT', 'FN', 'IY']
+            plain = 'DOXWETTERBERICHTXNO'
+            cipher = compiled.CompiledEnigma('IV', 'I', 'V', 'B', 'GTO', 'QEB', cables).translate(plain)
+            hits = list(drag('WETTERBERICHT', cipher, ('I', 'IV', 'V'), pos='GTO', cables=cables, processes=2))
+            self.assertIn(Drag(3, batch.Key(('IV', 'I', 'V'), 'B', 'GTO', 'QEB', cables)), hits)
+            for offset, key in hits:
+                self.assertEqual(batch.make_machine(key).translateAt('WETTERBERICHT', offset),
+                                 cipher[offset:offset + 13])
+
+        def test_search_space(self):
+            import os
+            import tempfile
+
+            import keyspace
+
+            cables = ['AL', 'CT', 'FN', 'IY']
+            p = 'A' * 10
+            c = compiled.CompiledEnigma('IV', 'I', 'V', 'B', 'GTO', 'QEB', cables).translate(p)
+            space = keyspace.KeySpace(('I', 'IV', 'V'), positions=['GTO'], cables=cables)
+            self.assertEqual(sorted(search_space(space, p, c, 16, 2)),
+                             sorted(search(p, c, ('I', 'IV', 'V'), pos='GTO', cables=cables, processes=2)))
+
+            with tempfile.TemporaryDirectory() as d:
+                cp = keyspace.Checkpoint(os.path.join(d, 'cp.json'))
+                keys = search_space(space, p, c, 16, 2, cp)
+                next(keys)
+                keys.close()
+                rest = cp.load()
+                self.assertLess(len(rest), len(space))
+                self.assertEqual(rest.stop, space.stop)
+
+    unittest.main()
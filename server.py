@@ -0,0 +1,224 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import re
+
+import batch
+
+# One JSON object per line in each direction.  A request carries
+#   {"id": ..., "rotors": [...], "rf": "B", "pos": "AAA", "ring": "AAA",
+#    "cables": [...], "text": "HELLO"}
+# and is answered with {"id": ..., "text": ...} or {"id": ..., "error": ...}.
+# Answers on one connection come back in completion order.
+
+class RequestError(Exception): pass
+
+LETTERS = re.compile('[A-Z]*')
+
+def parse(line):
+    try:
+        req = json.loads(line)
+        key = batch.Key(tuple(req['rotors']), req['rf'], req.get('pos'), req.get('ring'),
+                        req.get('cables'))
+        text = req['text']
+    except (ValueError, KeyError, TypeError) as e:
+        raise RequestError(f'bad request: {e}')
+    if len(key.rotors) not in (3, 4) or not all(isinstance(r, str) for r in key.rotors) or \
+            not isinstance(key.rf, str):
+        raise RequestError('need 3 or 4 rotor names and a reflector name')
+    if not isinstance(text, str) or not LETTERS.fullmatch(text):
+        raise RequestError('need text of letters A-Z')
+    for setting in (key.pos, key.ring):
+        if setting is not None and (not isinstance(setting, str) or len(setting) != len(key.rotors) or
+                                    not LETTERS.fullmatch(setting)):
+            raise RequestError('pos and ring need one letter A-Z per rotor')
+    if key.cables is not None:
+        if not isinstance(key.cables, list) or not all(isinstance(c, str) and len(c) == 2 and LETTERS.fullmatch(c)
+                                                       for c in key.cables):
+            raise RequestError('cables need to be a list of letter pairs A-Z')
+        plugs = ''.join(key.cables)
+        if len(set(plugs)) != len(plugs):
+            raise RequestError('cables plug each letter at most once')
+    return req.get('id'), key, text
+
+def _translate(key, text):
+    return batch.make_machine(key).translate(text)
+
+class MachinePool(object):
+    # configured machines keyed by everything but the start position
+    def __init__(self, size=256):
+        self.size = size
+        self.machines = collections.OrderedDict()
+
+    def get(self, key):
+        config = (key.rotors, key.rf, key.ring, None if key.cables is None else tuple(key.cables))
+        m = self.machines.get(config)
+        if m is None:
+            m = self.machines[config] = batch.make_machine(key._replace(pos=None))
+            if len(self.machines) > self.size:
+                self.machines.popitem(last=False)
+        else:
+            self.machines.move_to_end(config)
+        m.setPosition(key.pos or 'A' * len(key.rotors))
+        return m
+
+class Server(object):
+    def __init__(self, pool_size=256, threshold=4096, processes=None):
+        self.pool = MachinePool(pool_size)
+        self.threshold = threshold
+        self.processes = processes
+        self.executor = None
+        self.server = None
+        self.handlers = set()
+
+    async def start(self, path=None, host='127.0.0.1', port=0):
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.processes)
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        for task in self.handlers:
+            task.cancel()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        await self.server.wait_closed()
+        self.executor.shutdown()
+
+    async def translate(self, key, text):
+        if len(text) < self.threshold:
+            # short requests are cheaper than a round trip to a worker and
+            # run to completion, so the pooled machine is not shared
+            return self.pool.get(key).translate(text)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _translate, key, text)
+
+    async def answer(self, line, writer):
+        rid = None
+        try:
+            rid, key, text = parse(line)
+            reply = {'id': rid, 'text': await self.translate(key, text)}
+        except (RequestError, KeyError, ValueError) as e:
+            reply = {'id': rid, 'error': str(e)}
+        writer.write(json.dumps(reply).encode() + b'\n')
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        tasks = set()
+        self.handlers.add(asyncio.current_task())
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self.answer(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+        finally:
+            self.handlers.discard(asyncio.current_task())
+            writer.close()
+
+async def serve(args):
+    server = Server(args.pool, args.threshold, args.processes)
+    s = await server.start(args.socket, args.host, args.port)
+    async with s:
+        await s.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve encryption requests as line-delimited JSON.')
+    parser.add_argument('-s', '--socket', help='listen on this unix socket instead of TCP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=8765)
+    parser.add_argument('--pool', type=int, default=256, help='configured machines to keep')
+    parser.add_argument('--threshold', type=int, default=4096, help='send texts this long to a worker')
+    parser.add_argument('--processes', type=int, help='worker processes')
+    asyncio.run(serve(parser.parse_args(argv)))
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import tempfile
+    import unittest
+
+    import enigma
+
+    # python server.py serve [options] runs the server, anything else the tests
+    if sys.argv[1:2] == ['serve']:
+        sys.exit(main(sys.argv[2:]))
+
+    class TestServer(unittest.IsolatedAsyncioTestCase):
+
+        async def asyncSetUp(self):
+            self.tmp = tempfile.TemporaryDirectory()
+            self.path = os.path.join(self.tmp.name, 'enigma.sock')
+            asyncio.get_running_loop().set_debug(False)
+            self.server = Server(pool_size=2, threshold=1000, processes=1)
+            await self.server.start(self.path)
+            self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+
+        async def asyncTearDown(self):
+            self.writer.close()
+            await self.server.close()
+            self.tmp.cleanup()
+
+        async def request(self, **req):
+            self.writer.write(json.dumps(req).encode() + b'\n')
+            return json.loads(await self.reader.readline())
+
+        async def test_translate(self):
+            reply = await self.request(id=1, rotors=['I', 'II', 'III'], rf='B', text='A' * 20)
+            self.assertEqual(reply, {'id': 1, 'text': 'BDZGOWCXLTKSBTMCDLPB'})
+            args = ('I', 'IV', 'V'), 'B', 'FJN', 'AOA', ['AL', 'CT', 'FN', 'OY']
+            want = enigma.Enigma(*args[0], *args[1:]).translate('HELLOWORLD')
+            for i in range(3):
+                reply = await self.request(id=i, rotors=args[0], rf='B', pos='FJN', ring='AOA',
+                                           cables=args[4], text='HELLOWORLD')
+                self.assertEqual(reply['text'], want)
+            self.assertEqual(len(self.server.pool.machines), 2)
+
+        async def test_concurrent(self):
+            keys = [('I', 'II', 'III'), ('III', 'II', 'I'), ('V', 'I', 'IV'), ('Beta', 'I', 'II', 'III')]
+            want = {}
+            for i in range(200):
+                rotors = keys[i % len(keys)]
+                pos = 'QDVA'[:len(rotors)] if i % 3 else None
+                text = 'A' * (5000 if i == 7 else i % 50)
+                rf = 'BThin' if len(rotors) == 4 else 'B'
+                e = (enigma.Enigma4 if len(rotors) == 4 else enigma.Enigma)(*rotors, rf, pos)
+                want[i] = e.translate(text)
+                self.writer.write(json.dumps({'id': i, 'rotors': rotors, 'rf': rf, 'pos': pos,
+                                              'text': text}).encode() + b'\n')
+            got = {}
+            for _ in range(200):
+                reply = json.loads(await self.reader.readline())
+                got[reply['id']] = reply['text']
+            self.assertEqual(got, want)
+            self.assertLessEqual(len(self.server.pool.machines), 2)
+
+        async def test_errors(self):
+            self.writer.write(b'not json\n')
+            self.assertIn('error', json.loads(await self.reader.readline()))
+            reply = await self.request(id=2, rotors=['I', 'II', 'XX'], rf='B', text='A')
+            self.assertEqual(reply['id'], 2)
+            self.assertIn('error', reply)
+            reply = await self.request(id=3, rotors=['I', 'II', 'III'], rf='B', text='hello')
+            self.assertIn('error', reply)
+            reply = await self.request(id=4, rotors=['I', 'II', 'III'], rf='B', pos='a1', text='A')
+            self.assertIn('error', reply)
+            for bad in ({'pos': 123}, {'ring': ['A', 'A', 'A']}, {'rf': ['B']}, {'rotors': [[1], 'II', 'III']},
+                        {'rotors': 'I'}, {'rf': None}):
+                reply = await self.request(**{'id': 6, 'rotors': ['I', 'II', 'III'], 'rf': 'B', 'text': 'A', **bad})
+                self.assertIn('error', reply)
+            for cables in (['AA'], 5, ['AB', 'BC'], ['ABC'], ['ab'], [1]):
+                reply = await self.request(id=5, rotors=['I', 'II', 'III'], rf='B', cables=cables, text='A')
+                self.assertIn('error', reply)
+            reply = await self.request(id=4, rotors=['I', 'II', 'III'], rf='B', text='A')
+            self.assertEqual(reply['text'], 'B')
+
+    unittest.main()
@@ -0,0 +1,189 @@
+import collections
+import contextlib
+import json
+import time
+
+# Instrumentation is off unless enabled.  Hot code checks stats.ENABLED once
+# per call (not per character) and only then counts or times anything.
+ENABLED = False
+
+counters = collections.Counter()
+timings = {}
+
+class Histogram(object):
+    # nanosecond timings in power of two buckets
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.buckets = collections.Counter()
+
+    def add(self, ns):
+        self.count += 1
+        self.total += ns
+        self.min = ns if self.min is None else min(self.min, ns)
+        self.max = max(self.max, ns)
+        self.buckets[ns.bit_length()] += 1
+
+    def merge(self, d):
+        self.count += d['count']
+        self.total += d['total']
+        if d['min'] is not None:
+            self.min = d['min'] if self.min is None else min(self.min, d['min'])
+        self.max = max(self.max, d['max'])
+        for bits, n in d['buckets'].items():
+            self.buckets[int(bits)] += n
+
+    def as_dict(self):
+        return {'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max,
+                'buckets': dict(sorted(self.buckets.items()))}
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = on
+
+def reset():
+    counters.clear()
+    timings.clear()
+
+def count(name, n=1):
+    if ENABLED:
+        counters[name] += n
+
+def add_time(phase, ns):
+    h = timings.get(phase)
+    if h is None:
+        h = timings[phase] = Histogram()
+    h.add(ns)
+
+@contextlib.contextmanager
+def timer(phase):
+    if not ENABLED:
+        yield
+        return
+    t = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        add_time(phase, time.perf_counter_ns() - t)
+
+def snapshot(caches=True):
+    snap = {'counters': dict(counters),
+            'timings': {phase: h.as_dict() for phase, h in timings.items()}}
+    if caches:
+        import compiled
+        snap['caches'] = compiled.cache_stats()
+    return snap
+
+def merge(snap):
+    counters.update(snap['counters'])
+    for phase, d in snap['timings'].items():
+        timings.setdefault(phase, Histogram()).merge(d)
+
+def export(path):
+    with open(path, 'w') as f:
+        json.dump(snapshot(), f, indent=2)
+        f.write('\n')
+
+@contextlib.contextmanager
+def record(path):
+    # counts and times the block from scratch and saves the result as JSON,
+    # also when the block fails; a path of None records nothing
+    if path is None:
+        yield
+        return
+    reset()
+    enable()
+    try:
+        yield
+    finally:
+        enable(False)
+        export(path)
+
+class Collect(object):
+    # Wraps a pool worker so it returns (result, stats of this job) and the
+    # parent can merge what its workers saw.
+    def __init__(self, worker, enabled=None):
+        self.worker = worker
+        self.enabled = ENABLED if enabled is None else enabled
+
+    def __call__(self, job):
+        if not self.enabled:
+            return self.worker(job), None
+        enable()
+        reset()
+        with timer('shard'):
+            result = self.worker(job)
+        return result, snapshot(caches=False)
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    import unittest
+
+    class TestStats(unittest.TestCase):
+
+        def tearDown(self):
+            enable(False)
+            reset()
+
+        def test_disabled(self):
+            count('chars', 10)
+            with timer('step'):
+                pass
+            self.assertEqual(snapshot(caches=False), {'counters': {}, 'timings': {}})
+
+        def test_enabled(self):
+            enable()
+            count('chars', 10)
+            count('chars')
+            for _ in range(3):
+                with timer('step'):
+                    time.sleep(0.001)
+            snap = snapshot()
+            self.assertEqual(snap['counters'], {'chars': 11})
+            self.assertEqual(snap['timings']['step']['count'], 3)
+            self.assertGreaterEqual(snap['timings']['step']['min'], 1000000)
+            self.assertIn('scramblers', snap['caches'])
+
+        def test_merge(self):
+            enable()
+            count('keys', 5)
+            add_time('shard', 100)
+            snap = snapshot(caches=False)
+            merge(json.loads(json.dumps(snap)))
+            self.assertEqual(counters['keys'], 10)
+            self.assertEqual(timings['shard'].as_dict()['buckets'], {7: 2})
+
+        def test_collect(self):
+            result, snap = Collect(len, enabled=True)('abc')
+            self.assertEqual(result, 3)
+            self.assertEqual(snap['timings']['shard']['count'], 1)
+            enable(False)
+            self.assertEqual(Collect(len)('abc'), (3, None))
+
+        def test_export(self):
+            enable()
+            count('keys', 7)
+            with tempfile.TemporaryDirectory() as d:
+                path = os.path.join(d, 'stats.json')
+                export(path)
+                with open(path) as f:
+                    self.assertEqual(json.load(f)['counters'], {'keys': 7})
+
+        def test_record(self):
+            with tempfile.TemporaryDirectory() as d:
+                path = os.path.join(d, 'stats.json')
+                with self.assertRaises(ZeroDivisionError):
+                    with record(path):
+                        count('keys', 3)
+                        1 / 0
+                self.assertFalse(ENABLED)
+                with open(path) as f:
+                    self.assertEqual(json.load(f)['counters'], {'keys': 3})
+                with record(None):
+                    count('keys')
+                self.assertEqual(counters['keys'], 3)
+
+    unittest.main()
@@ -0,0 +1,158 @@
+import array
+import math
+
+import compiled
+
+A = ord('A')
+
+def step(state, notches):
+    l, m, r = state // 676, state // 26 % 26, state % 26
+    _, n2, n3 = notches
+    if m in n2:
+        m = (m + 1) % 26
+        l = (l + 1) % 26
+    elif r in n3:
+        m = (m + 1) % 26
+    r = (r + 1) % 26
+    return (l * 26 + m) * 26 + r
+
+class Stepping(object):
+    # Rotor positions of the three stepping rotors (left, middle, right) are
+    # packed into one state index l * 676 + m * 26 + r.  The left rotor never
+    # influences stepping, so a full revolution of the right rotor moves the
+    # middle rotor by a fixed map G[m] and the left rotor by D[m].  Iterating
+    # G from the start position enters a cycle within 26 revolutions, which
+    # gives any future state with at most 26 single steps.
+    def __init__(self, r1, r2, r3, pos=None):
+        self.notches = [frozenset(compiled.rotor_wiring(r)[1]) for r in (r1, r2, r3)]
+        if pos is None:
+            pos = 'AAA'
+        l, m, r = (ord(p) - A for p in pos[-3:])
+        self.start = (l * 26 + m) * 26 + r
+
+        G = []
+        D = []
+        for m in range(26):
+            s = m * 26 + r
+            for _ in range(26):
+                s = step(s, self.notches)
+            G.append(s // 26 % 26)
+            D.append(s // 676)
+
+        # walk G from the starting middle rotor position until it repeats
+        seen = {}
+        self.middle = []
+        self.left = [0]
+        m = self.start // 26 % 26
+        while m not in seen:
+            seen[m] = len(self.middle)
+            self.middle.append(m)
+            self.left.append(self.left[-1] + D[m])
+            m = G[m]
+        self.tail = seen[m]
+        self.cycle = len(self.middle) - self.tail
+        self.cycle_left = self.left[-1] - self.left[self.tail]
+
+    def period(self):
+        return 26 * self.cycle * 26 // math.gcd(26, self.cycle_left)
+
+    def transient(self):
+        return 26 * self.tail
+
+    def state(self, k):
+        q, s = divmod(k, 26)
+        if q < len(self.middle):
+            m = self.middle[q]
+            l = self.left[q]
+        else:
+            n, q = divmod(q - self.tail, self.cycle)
+            m = self.middle[self.tail + q]
+            l = self.left[self.tail + q] + n * self.cycle_left
+        l = (self.start // 676 + l) % 26
+        state = (l * 26 + m) * 26 + self.start % 26
+        for _ in range(s):
+            state = step(state, self.notches)
+        return state
+
+    def positions(self, length, start=0):
+        # states after each of the keystrokes start + 1 .. start + length
+        period = self.period()
+        n = min(length, max(0, self.transient() - start) + period)
+        out = array.array('H')
+        state = self.state(start)
+        _, n2, n3 = self.notches
+        l, m, r = state // 676, state // 26 % 26, state % 26
+        for _ in range(n):
+            if m in n2:
+                m = (m + 1) % 26
+                l = (l + 1) % 26
+            elif r in n3:
+                m = (m + 1) % 26
+            r = (r + 1) % 26
+            out.append((l * 26 + m) * 26 + r)
+        if length > n:
+            block = out[n - period:n]
+            out.extend(block * ((length - n) // period + 1))
+            del out[length:]
+        return out
+
+def position_string(state):
+    return chr(A + state // 676) + chr(A + state // 26 % 26) + chr(A + state % 26)
+
+if __name__ == '__main__':
+    import random
+    import unittest
+
+    import enigma
+
+    class TestStepping(unittest.TestCase):
+
+        def reference(self, rotors, pos, length):
+            e = enigma.Enigma(*rotors, 'B', pos)
+            out = []
+            for _ in range(length):
+                e.translate('A')
+                out.append(e.getPosition())
+            return out
+
+        def test_positions(self):
+            random.seed(1)
+            for rotors in (('I', 'II', 'III'), ('I', 'IV', 'V'), ('VI', 'VII', 'VIII'), ('III', 'VI', 'II')):
+                for _ in range(5):
+                    pos = ''.join(random.choice(compiled.ALPHA) for _ in range(3))
+                    s = Stepping(*rotors, pos)
+                    self.assertEqual([position_string(p) for p in s.positions(1500)],
+                                     self.reference(rotors, pos, 1500))
+
+        def test_state(self):
+            s = Stepping('III', 'IV', 'V', 'QIY')
+            self.assertEqual(position_string(s.state(0)), 'QIY')
+            self.assertEqual(position_string(s.state(2)), 'QJA')
+            self.assertEqual(position_string(s.state(3)), 'RKB')
+            self.assertEqual(position_string(s.state(5)), 'RKD')
+
+        def test_seek(self):
+            for rotors, pos in ((('I', 'II', 'III'), 'AAA'), (('V', 'VI', 'VIII'), 'XMZ'), (('I', 'IV', 'V'), 'FJN')):
+                s = Stepping(*rotors, pos)
+                full = s.positions(40000)
+                for k in (0, 1, 25, 26, 649, 650, 651, 16899, 16900, 16901, 33000, 39990):
+                    self.assertEqual(s.state(k + 1), full[k])
+                    self.assertEqual(s.positions(5, k), full[k:k + 5])
+
+        def test_period(self):
+            self.assertEqual(Stepping('I', 'II', 'III').period(), 16900)
+            s = Stepping('I', 'II', 'III', 'KDO')
+            p = s.positions(17000 + s.transient())
+            t = s.transient()
+            self.assertEqual(p[t:t + 100], p[t + 16900:t + 17000])
+            s = Stepping('I', 'VI', 'VII')
+            p = s.positions(3 * s.period())
+            self.assertEqual(p[:s.period()], p[s.period():2 * s.period()])
+
+        def test_double_step(self):
+            s = Stepping('I', 'IV', 'V', 'FJN')
+            self.assertEqual(position_string(s.state(1)), 'GKO')
+            s = Stepping('I', 'IV', 'V', 'GJO')
+            self.assertEqual(position_string(s.state(1)), 'HKP')
+
+    unittest.main()
@@ -0,0 +1,58 @@
+import re
+
+CHUNK_SIZE = 1 << 16
+
+def normalize(text):
+    text = text.replace(' ', 'X').upper()
+    return re.sub(r'[^A-Z]', '', text)
+
+def read_chunks(f, size=CHUNK_SIZE):
+    return iter(lambda: f.read(size), f.read(0))
+
+def translate_stream(machine, chunks, norm=True):
+    # the machine keeps its rotor positions between translate calls, so
+    # chunk boundaries do not change the output
+    for chunk in chunks:
+        if norm:
+            chunk = normalize(chunk)
+        if chunk:
+            yield machine.translate(chunk)
+
+def translate_file(machine, fin, fout, size=CHUNK_SIZE, norm=True):
+    for chunk in translate_stream(machine, read_chunks(fin, size), norm):
+        fout.write(chunk)
+
+if __name__ == '__main__':
+    import io
+    import unittest
+
+    import compiled
+    import enigma
+
+    class TestStream(unittest.TestCase):
+
+        text = 'Rule one of cryptanalysis: check for plaintext. ' * 50
+
+        def test_normalize(self):
+            self.assertEqual(normalize('Be Sure To Drink Your Ovaltine.'), 'BEXSUREXTOXDRINKXYOURXOVALTINE')
+            self.assertEqual(normalize('1, 2: 3!'), 'XX')
+
+        def test_chunks(self):
+            for size in (1, 7, 64, 10000):
+                e = enigma.Enigma('I', 'IV', 'V', 'B', 'FJN', 'AOA', ['AL', 'CT', 'FN', 'OY'])
+                c = compiled.CompiledEnigma('I', 'IV', 'V', 'B', 'FJN', 'AOA', ['AL', 'CT', 'FN', 'OY'])
+                chunks = [self.text[i:i + size] for i in range(0, len(self.text), size)]
+                self.assertEqual(''.join(translate_stream(c, chunks)), e.translate(normalize(self.text)))
+
+        def test_file(self):
+            e = compiled.CompiledEnigma('I', 'II', 'III', 'B')
+            fout = io.StringIO()
+            translate_file(e, io.StringIO(self.text), fout, size=100)
+            e.setPosition('AAA')
+            self.assertEqual(fout.getvalue(), e.translate(normalize(self.text)))
+
+        def test_raw(self):
+            e = compiled.CompiledEnigma('I', 'II', 'III', 'B')
+            self.assertEqual(''.join(translate_stream(e, ['AAAAA'] * 4, norm=False)), 'BDZGOWCXLTKSBTMCDLPB')
+
+    unittest.main()
@@ -0,0 +1,151 @@
+import hashlib
+import itertools
+import mmap
+import os
+import tempfile
+
+import compiled
+
+class TableCacheError(Exception): pass
+
+# A cache file holds the raw scrambler data followed by a footer of the
+# SHA-256 of the wiring it was built from and a magic number, so the data
+# starts at offset 0 and the mmap can be indexed exactly like Scrambler.data.
+MAGIC = b'EMTB'
+SIZE = 26 ** 4
+FOOTER = 32 + len(MAGIC)
+
+def digest(rotors, reflector):
+    h = hashlib.sha256(MAGIC)
+    for r in rotors:
+        h.update(bytes(w % 26 for w in compiled.rotor_wiring(r)[0]))
+    h.update(bytes(reflector))
+    return h.digest()
+
+def path_of(rotors, reflector, directory):
+    return os.path.join(directory, digest(rotors, reflector).hex() + '.tbl')
+
+def store(scrambler, directory):
+    os.makedirs(directory, exist_ok=True)
+    path = path_of(scrambler.rotors, scrambler.reflector, directory)
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(scrambler.data)
+        f.write(digest(scrambler.rotors, scrambler.reflector) + MAGIC)
+    os.replace(tmp, path)
+    return path
+
+def load(rotors, reflector, directory):
+    try:
+        f = open(path_of(rotors, reflector, directory), 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        if os.fstat(f.fileno()).st_size != SIZE + FOOTER:
+            raise TableCacheError(f'{f.name} has the wrong size')
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if data[SIZE:] != digest(rotors, reflector) + MAGIC:
+        raise TableCacheError(f'{f.name} was built from different wiring')
+    return compiled.Scrambler(rotors, reflector, data)
+
+def open_scrambler(rotors, reflector, directory):
+    # worker processes map the same file read-only and share its pages
+    s = load(rotors, reflector, directory)
+    if s is None:
+        store(compiled.Scrambler(rotors, reflector), directory)
+        s = load(rotors, reflector, directory)
+    return s
+
+def build(rotors, reflectors, directory, greeks=()):
+    # with greeks, build the M4 tables: every greek wheel offset folded into
+    # every (thin) reflector
+    perms = []
+    for rf in reflectors:
+        perm = compiled.reflector_perm(rf)
+        if not greeks:
+            perms.append(perm)
+        perms.extend(compiled.greek_reflector(g, o, perm) for g in greeks for o in range(26))
+    paths = []
+    for order in itertools.permutations(rotors, 3):
+        for perm in perms:
+            paths.append(path_of(order, perm, directory))
+            if not os.path.exists(paths[-1]):
+                store(compiled.Scrambler(order, perm), directory)
+    return paths
+
+def evict(directory, keep=()):
+    # remove every cached table except the given paths
+    keep = {os.path.abspath(p) for p in keep}
+    for name in os.listdir(directory):
+        path = os.path.abspath(os.path.join(directory, name))
+        if name.endswith('.tbl') and path not in keep:
+            os.remove(path)
+
+if __name__ == '__main__':
+    import unittest
+
+    class TestTableCache(unittest.TestCase):
+
+        def setUp(self):
+            self.tmp = tempfile.TemporaryDirectory()
+            self.dir = self.tmp.name
+            self.rf = compiled.reflector_perm('B')
+
+        def tearDown(self):
+            self.tmp.cleanup()
+
+        def test_roundtrip(self):
+            self.assertIsNone(load(('I', 'II', 'III'), self.rf, self.dir))
+            s = open_scrambler(('I', 'II', 'III'), self.rf, self.dir)
+            self.assertIsInstance(s.data, mmap.mmap)
+            ref = compiled.Scrambler(('I', 'II', 'III'), self.rf)
+            self.assertEqual(s.data[:SIZE], ref.data)
+            self.assertEqual(s.perm(1234), ref.perm(1234))
+
+        def test_wiring_hash(self):
+            self.assertNotEqual(path_of(('I', 'II', 'III'), self.rf, self.dir),
+                                path_of(('I', 'II', 'IV'), self.rf, self.dir))
+            self.assertNotEqual(path_of(('I', 'II', 'III'), self.rf, self.dir),
+                                path_of(('I', 'II', 'III'), compiled.reflector_perm('C'), self.dir))
+
+        def test_stale(self):
+            s = compiled.Scrambler(('I', 'II', 'III'), self.rf)
+            path = store(s, self.dir)
+            os.replace(path, path_of(('I', 'II', 'IV'), self.rf, self.dir))
+            self.assertRaises(TableCacheError, load, ('I', 'II', 'IV'), self.rf, self.dir)
+            with open(path, 'wb') as f:
+                f.write(b'short')
+            self.assertRaises(TableCacheError, load, ('I', 'II', 'III'), self.rf, self.dir)
+
+        def test_build_evict(self):
+            paths = build(('I', 'II', 'III'), ('B',), self.dir)
+            self.assertEqual(len(paths), 6)
+            self.assertEqual(len(os.listdir(self.dir)), 6)
+            evict(self.dir, paths[:2])
+            self.assertEqual(sorted(os.listdir(self.dir)), sorted(os.path.basename(p) for p in paths[:2]))
+
+        def test_build_m4(self):
+            paths = build(('I', 'II', 'III'), ('BThin',), self.dir, greeks=('Beta',))
+            self.assertEqual(len(paths), 6 * 26)
+            os.environ['EMUCRYPT_CACHE'] = self.dir
+            try:
+                compiled.SCRAMBLERS.clear()
+                c = compiled.CompiledEnigma4('Beta', 'II', 'I', 'III', 'BThin', 'QAAA', 'CAAA').translate('A' * 50)
+            finally:
+                del os.environ['EMUCRYPT_CACHE']
+                compiled.SCRAMBLERS.clear()
+            self.assertEqual(len(os.listdir(self.dir)), 6 * 26)
+            self.assertEqual(c, compiled.CompiledEnigma4('Beta', 'II', 'I', 'III', 'BThin', 'QAAA', 'CAAA').translate('A' * 50))
+
+        def test_machine(self):
+            os.environ['EMUCRYPT_CACHE'] = self.dir
+            try:
+                compiled.SCRAMBLERS.clear()
+                c = compiled.CompiledEnigma('VIII', 'VII', 'VI', 'C', ring='VGI').translate('A' * 100)
+            finally:
+                del os.environ['EMUCRYPT_CACHE']
+                compiled.SCRAMBLERS.clear()
+            self.assertEqual(c, compiled.CompiledEnigma('VIII', 'VII', 'VI', 'C', ring='VGI').translate('A' * 100))
+            self.assertEqual(len(os.listdir(self.dir)), 1)
+
+    unittest.main()